@@ -0,0 +1,108 @@
+"""
+Measures the size and parse-time savings of polyline-encoded geometry against plain GeoJSON
+for one hourly snapshot, built the same way generate_snapshot.py builds it.
+
+Usage (from the scripts/ folder):
+    python benchmark_geometry_encoding.py --timestamp "2024-12-02 08:00" --precisions 4 5 6
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import statistics
+import time
+
+import pandas as pd
+from processor.osm_matcher import StreetMatcher
+from processor.geometry_codec import encode_geometry, decode_geometry
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DATA_PATH = os.path.join(ROOT_DIR, "src", "data", "processed", "kpi_enriched_dec_2024.parquet")
+
+
+def build_snapshot_features(ts_str: str, kpi_col: str) -> list:
+    df = pd.read_parquet(DATA_PATH)
+    df["timestamp"] = df["tag"].dt.strftime("%Y-%m-%d") + " " + df["hour"].astype(str).str.zfill(2) + ":00"
+    df_ts = df[df["timestamp"] == ts_str].copy()
+    if df_ts.empty:
+        raise SystemExit(f"No data for timestamp {ts_str}")
+
+    matcher = StreetMatcher()
+    matcher.load_osm_network()
+    gdf_road_kpi = matcher.aggregate_kpi_by_osm_segment(matcher.match_detectors_to_segments(df_ts), kpi_col=kpi_col)
+    gdf_road_kpi["geometry"] = gdf_road_kpi["geometry"].simplify(0.0001, preserve_topology=True)
+    # Round-trip through JSON so coordinates are plain lists, as stored in MongoDB
+    return json.loads(json.dumps(gdf_road_kpi.__geo_interface__["features"]))
+
+
+def median_ms(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def max_error_m(features: list, decoded_features: list) -> float:
+    # Equirectangular distance is accurate enough at metre scale
+    max_error = 0.0
+    for original, decoded in zip(features, decoded_features):
+        flat_original = _flatten(original["geometry"]["coordinates"])
+        flat_decoded = _flatten(decoded["geometry"]["coordinates"])
+        for (lon1, lat1), (lon2, lat2) in zip(flat_original, flat_decoded):
+            dx = math.radians(lon2 - lon1) * math.cos(math.radians(lat1)) * 6371000
+            dy = math.radians(lat2 - lat1) * 6371000
+            max_error = max(max_error, math.hypot(dx, dy))
+    return max_error
+
+
+def _flatten(coordinates) -> list:
+    if isinstance(coordinates[0], (int, float)):
+        return [coordinates[:2]]
+    return [position for part in coordinates for position in _flatten(part)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timestamp", default="2024-12-02 08:00", help="Snapshot hour to benchmark")
+    parser.add_argument("--kpi-col", default="q_kfz_det_hr", help="KPI column used for the snapshot values")
+    parser.add_argument("--precisions", type=int, nargs="+", default=[4, 5, 6], help="Decimal precisions to compare")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions (median is reported)")
+    args = parser.parse_args()
+
+    features = build_snapshot_features(args.timestamp, args.kpi_col)
+    geojson_str = json.dumps({"features": features})
+
+    rows = [{
+        "format": "GeoJSON (current)",
+        "bytes": len(geojson_str.encode()),
+        "gzip_bytes": len(gzip.compress(geojson_str.encode())),
+        "parse_ms": median_ms(lambda: json.loads(geojson_str), args.repeat),
+        "decode_ms": 0.0,
+        "max_error_m": 0.0,
+    }]
+
+    for precision in args.precisions:
+        encoded_features = [dict(f, geometry=encode_geometry(f["geometry"], precision)) for f in features]
+        encoded_str = json.dumps({"features": encoded_features})
+        decoded_features = [dict(f, geometry=decode_geometry(f["geometry"])) for f in encoded_features]
+        rows.append({
+            "format": f"Polyline p={precision}",
+            "bytes": len(encoded_str.encode()),
+            "gzip_bytes": len(gzip.compress(encoded_str.encode())),
+            "parse_ms": median_ms(lambda: json.loads(encoded_str), args.repeat),
+            "decode_ms": median_ms(lambda: [decode_geometry(f["geometry"]) for f in encoded_features], args.repeat),
+            "max_error_m": max_error_m(features, decoded_features),
+        })
+
+    df_results = pd.DataFrame(rows).set_index("format")
+    df_results["size_vs_geojson"] = df_results["bytes"] / df_results.loc["GeoJSON (current)", "bytes"]
+    print(f"Snapshot {args.timestamp}: {len(features)} segments")
+    print(df_results.round(3).to_string())
+    print("\nparse_ms is Python json.loads; decode_ms is the extra polyline decoding (done once per segment in the browser).")
+
+
+if __name__ == "__main__":
+    main()
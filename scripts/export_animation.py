@@ -0,0 +1,244 @@
+"""
+Pre-renders the map animation of one vehicle type/KPI and time range into a static asset for wall
+displays and embeds: one PNG per hour plus a looping animated GIF, drawn with the dashboard's color
+scales (streamlit_app/map_html.py). Frames are rendered in parallel, one process per core.
+
+Values come from the generator's value matrix where it covers the range, otherwise from MongoDB.
+The export is written below streamlit_app/static/exports/, which the dashboard serves as static
+files, so displays looping it put no load on MongoDB or on the app's scripts:
+
+    http://<dashboard>/app/static/exports/<name>/animation.gif
+
+Usage (from the scripts/ folder):
+    python export_animation.py --vehicle-type all --kpi number_of_vehicles --start "2024-12-02 00:00" --hours 24
+    python export_animation.py --vehicle-type trucks --kpi avg_speed --start "2024-12-02 06:00" --hours 12 --width 1920
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT_DIR, "streamlit_app"))
+
+import data_access # The dashboard's modules (streamlit_app/ is not a package)
+from map_html import COLOR_SCALES, color_scale_key, get_color
+from processor.geometry_codec import decode_geometry
+
+COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME", "road_kpi_snapshots")
+DEFAULT_EXPORT_DIR = os.path.join(ROOT_DIR, "streamlit_app", "static", "exports")
+
+# Display names as in the dashboard's sidebar
+VEHICLE_TYPE_LABELS = {"all": "All Vehicles", "cars": "Cars", "trucks": "Trucks"}
+KPI_TYPE_LABELS = {"number_of_vehicles": "Number of Vehicles", "avg_speed": "Average Speed (km/h)"}
+
+BACKGROUND_COLOR = "#F2F2F0"
+LINE_WIDTH = 3 # Pixels at 1280 px width, scaled with --width
+PADDING = 0.03 # Fraction of the network extent kept free around it
+
+
+def load_frames(args, times: list) -> dict:
+    """
+    {timestamp: FeatureCollection} for the requested hours, in the same shape the dashboard renders.
+    """
+    # The snapshot hashes tell which matrix columns still match MongoDB (read from the covering index)
+    frame_manifest = data_access.load_frame_manifest(
+        args.mongo_uri, args.db_name, COLLECTION_NAME, args.vehicle_type, args.kpi, times
+    )
+    frames = {}
+    try:
+        value_matrix = data_access.ValueMatrix(args.matrix_dir, args.vehicle_type, args.kpi)
+        frames = value_matrix.frames(frame_manifest)
+        print(f"📐 {len(frames)} of {len(times)} frames from the value matrix in {args.matrix_dir}")
+    except FileNotFoundError:
+        print(f"No value matrix in {args.matrix_dir}, reading all frames from MongoDB")
+    except (KeyError, ValueError) as e:
+        print(f"Ignoring value matrix ({e}), reading all frames from MongoDB")
+
+    missing_times = [ts for ts in frame_manifest if ts not in frames]
+    if missing_times:
+        frames.update(data_access.load_snapshots_from_mongodb(
+            args.mongo_uri, args.db_name, COLLECTION_NAME, args.vehicle_type, args.kpi, missing_times
+        ))
+    return {ts: frames[ts] for ts in times if ts in frames}
+
+
+def _project(lon: float, lat: float) -> tuple:
+    # Web Mercator, like the dashboard's Leaflet map
+    return math.radians(lon), math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def _line_parts(geometry: dict) -> list:
+    geometry = decode_geometry(geometry)
+    if geometry["type"] == "LineString":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiLineString":
+        return geometry["coordinates"]
+    return []
+
+
+def build_segment_layout(frames: dict, width: int) -> tuple:
+    """
+    Collects every segment of the frames once, projected to pixel coordinates of a width-wide image.
+    Returns (segment_ids, pixel lines per segment, (width, height)).
+    """
+    segments = {}
+    for frame in frames.values():
+        for feature in frame["features"]:
+            segment_id = feature["properties"]["segment_id"]
+            if segment_id not in segments:
+                segments[segment_id] = [[_project(lon, lat) for lon, lat, *_ in part]
+                                        for part in _line_parts(feature["geometry"])]
+    segment_ids = list(segments)
+
+    points = np.array([point for parts in segments.values() for part in parts for point in part])
+    (min_x, min_y), (max_x, max_y) = points.min(axis=0), points.max(axis=0)
+    pad = PADDING * max(max_x - min_x, max_y - min_y)
+    min_x, min_y, max_x, max_y = min_x - pad, min_y - pad, max_x + pad, max_y + pad
+    scale = width / (max_x - min_x)
+    height = int(round((max_y - min_y) * scale))
+
+    pixel_lines = [
+        [[((x - min_x) * scale, (max_y - y) * scale) for x, y in part] for part in segments[segment_id]]
+        for segment_id in segment_ids
+    ]
+    return segment_ids, pixel_lines, (width, height)
+
+
+def frame_values(frames: dict, times: list, segment_ids: list) -> np.ndarray:
+    """
+    frames x segments float32 values (NaN where a segment has no value in that hour).
+    """
+    row_of = {segment_id: row for row, segment_id in enumerate(segment_ids)}
+    values = np.full((len(times), len(segment_ids)), np.nan, dtype=np.float32)
+    for i, ts in enumerate(times):
+        for feature in frames[ts]["features"]:
+            value = feature["properties"].get("value")
+            if value is not None:
+                values[i, row_of[feature["properties"]["segment_id"]]] = value
+    return values
+
+
+# --- Frame rendering (runs in the worker processes) ---
+_worker = {}
+
+def _init_worker(pixel_lines: list, size: tuple, color_scale: list, title: str):
+    # Geometry and scale are sent once per worker, not with every frame
+    factor = size[0] / 1280
+    _worker.update(
+        pixel_lines=pixel_lines,
+        size=size,
+        color_scale=color_scale,
+        title=title,
+        line_width=max(1, int(round(LINE_WIDTH * factor))),
+        font=ImageFont.load_default(size=max(10, int(round(14 * factor)))),
+        time_font=ImageFont.load_default(size=max(14, int(round(28 * factor)))),
+    )
+
+def _draw_legend(draw: ImageDraw.ImageDraw):
+    font, (width, height) = _worker["font"], _worker["size"]
+    line_height = int(font.size * 1.5)
+    labels = [label for _, _, _, label in _worker["color_scale"]]
+    box_width = max(draw.textlength(text, font=font) for text in labels + [_worker["title"]]) + 3 * line_height
+    box_height = (len(labels) + 1) * line_height + line_height // 2
+    left, top = width - box_width - line_height, height - box_height - line_height
+    draw.rectangle([left, top, left + box_width, top + box_height], fill="#FFFFFF", outline="#CCCCCC")
+    draw.text((left + line_height // 2, top + line_height // 4), _worker["title"], fill="#333333", font=font)
+    for i, (_, _, color, label) in enumerate(_worker["color_scale"], start=1):
+        y = top + line_height // 4 + i * line_height
+        draw.rectangle([left + line_height // 2, y, left + line_height * 3 // 2, y + font.size], fill=color)
+        draw.text((left + line_height * 2, y), label, fill="#333333", font=font)
+
+def render_frame(ts_str: str, values: np.ndarray, output_path: str) -> str:
+    image = Image.new("RGB", _worker["size"], BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+    for row in np.flatnonzero(~np.isnan(values)):
+        color = get_color(float(values[row]), _worker["color_scale"])
+        for part in _worker["pixel_lines"][row]:
+            if len(part) > 1:
+                draw.line(part, fill=color, width=_worker["line_width"], joint="curve")
+    draw.text((_worker["line_width"] * 6, _worker["line_width"] * 5), ts_str, fill="#333333", font=_worker["time_font"])
+    _draw_legend(draw)
+    image.save(output_path, optimize=True)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vehicle-type", choices=list(VEHICLE_TYPE_LABELS), default="all")
+    parser.add_argument("--kpi", choices=list(KPI_TYPE_LABELS), default="number_of_vehicles")
+    parser.add_argument("--start", required=True, help='First hour, e.g. "2024-12-02 00:00"')
+    parser.add_argument("--hours", type=int, default=24, help="Number of hourly frames")
+    parser.add_argument("--width", type=int, default=1280, help="Image width in pixels (height follows the map extent)")
+    parser.add_argument("--speed-ms", type=int, default=1000, help="Display time per frame in the animation")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Frames rendered in parallel")
+    parser.add_argument("--output-dir", default=DEFAULT_EXPORT_DIR, help="The export goes to a subfolder named after the selection")
+    parser.add_argument("--matrix-dir", default=data_access.VALUE_MATRIX_DIR)
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--db-name", default=os.getenv("MONGO_DB_NAME", "traffic_dashboard"))
+    args = parser.parse_args()
+
+    # The data functions use st.cache_*/st.error, which log "no runtime" warnings outside `streamlit run`
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    start = pd.Timestamp(args.start)
+    times = [ts.strftime("%Y-%m-%d %H:00") for ts in pd.date_range(start, periods=args.hours, freq="h")]
+    frames = load_frames(args, times)
+    if not frames:
+        print("❌ No data for the selected vehicle type, KPI and time range.")
+        sys.exit(1)
+    times = list(frames)
+
+    segment_ids, pixel_lines, size = build_segment_layout(frames, args.width)
+    values = frame_values(frames, times, segment_ids)
+    del frames # Only the projected geometry and the value matrix are needed from here on
+
+    name = f"{args.vehicle_type}_{args.kpi}_{start.strftime('%Y%m%d%H')}_{args.hours}h"
+    export_dir = os.path.join(args.output_dir, name)
+    os.makedirs(export_dir, exist_ok=True)
+
+    title = f"{VEHICLE_TYPE_LABELS[args.vehicle_type]} - {KPI_TYPE_LABELS[args.kpi]}"
+    color_scale = COLOR_SCALES[color_scale_key(args.kpi)]
+    frame_files = [f"frame_{i:04d}.png" for i in range(len(times))]
+
+    print(f"🎞️ Rendering {len(times)} frames of {len(segment_ids)} segments at {size[0]}x{size[1]} "
+          f"with {args.workers} workers...")
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(pixel_lines, size, color_scale, title)) as executor:
+        list(executor.map(render_frame, times, values, [os.path.join(export_dir, f) for f in frame_files]))
+    print(f"Rendered in {time.perf_counter() - started:.1f}s")
+
+    # One looping file for displays and embeds; the PNGs stay for custom players
+    images = [Image.open(os.path.join(export_dir, f)) for f in frame_files]
+    images[0].save(os.path.join(export_dir, "animation.gif"), save_all=True, append_images=images[1:],
+                   duration=args.speed_ms, loop=0)
+
+    with open(os.path.join(export_dir, "manifest.json"), "w") as f:
+        json.dump({
+            "vehicle_type": args.vehicle_type,
+            "kpi_type": args.kpi,
+            "times": times,
+            "frames": frame_files,
+            "animation": "animation.gif",
+            "speed_ms": args.speed_ms,
+            "width": size[0],
+            "height": size[1],
+        }, f, indent=2)
+
+    print(f"✅ Export written to {export_dir}")
+    print(f"   Served by the dashboard at /app/static/exports/{name}/animation.gif")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,25 @@
+"""
+Generates the hourly map snapshots, segment time series and district aggregates from the enriched
+detector data and writes them to MongoDB, or to local files that load_snapshots.py imports later.
+
+Usage (from the scripts/ folder):
+    python generate_snapshot.py                                # write to MongoDB directly
+    python generate_snapshot.py --sink ndjson --output-dir ../data/snapshots
+    python load_snapshots.py --input-dir ../data/snapshots     # then import into any database
+    python generate_snapshot.py --level mq                     # one row per cross-section instead of per lane,
+                                                               # into the _mq collections and value_matrix_mq/
+    python generate_snapshot.py --matrix-dir ""                # skip the dashboard's value matrices
+"""
+import argparse
 import pandas as pd
 import os
 import sys
 from processor.osm_matcher import StreetMatcher
-from pymongo import MongoClient
+from processor.timeseries import SegmentTimeSeriesBuilder
+from processor.districts import DistrictIndex, DistrictSnapshotBuilder
+from processor.snapshot_builder import SnapshotBuilder, kpi_combinations, add_timestamp_column
+from processor.snapshot_sink import MongoSnapshotSink, FileSnapshotSink, FILE_FORMATS
+from processor.value_matrix import write_value_matrices
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -11,108 +28,143 @@ ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 MONGO_URI = "mongodb://localhost:27017/" # For local testing
 DB_NAME = "traffic_dashboard"
 COLLECTION_NAME = "road_kpi_snapshots"
+TIMESERIES_COLLECTION_NAME = "road_kpi_timeseries" # Segment-major layout for per-road history lookups
+CATALOG_COLLECTION_NAME = "snapshot_catalog" # Available timestamps, read by the dashboard
+DISTRICT_COLLECTION_NAME = "road_kpi_district_snapshots" # Hourly per-district aggregates for low zoom levels
+DISTRICT_BOUNDARY_COLLECTION_NAME = "district_boundaries"
 
-# Establish MongoDB Connection
-try:
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    collection = db[COLLECTION_NAME]
-    print(f"Connected to MongoDB: {MONGO_URI}, Database: {DB_NAME}, Collection: {COLLECTION_NAME}")
-    
-    # Create indexes for efficient querying
-    collection.create_index([
-        ("timestamp", 1),
-        ("vehicle_type", 1),
-        ("kpi_type", 1)
-    ])
-    print("Created compound index on timestamp, vehicle_type, kpi_type.")
-
-except Exception as e:
-    print(f"Error connecting to MongoDB or delete many or creating index: {e}")
-    sys.exit(1) # Exit if cannot connect to DB
+# Road network tile size in degrees (0.05 = ~5.5 x 3.4 km). Only tiles containing detectors (plus their
+# neighbours) are downloaded, cached and held in memory. Set to None to load the whole place as one graph.
+NETWORK_TILE_SIZE = 0.05
 
+# Geometry is stored quantized to 10^-precision degrees and polyline-encoded (5 = ~1 m).
+# Set to None to store full-precision GeoJSON coordinates instead.
+GEOMETRY_PRECISION = 5
 
 # Paths relative to project root
 DATA_PATH = os.path.join(ROOT_DIR,"src","data", "processed", "kpi_enriched_dec_2024.parquet")
+MQ_DATA_PATH = os.path.join(ROOT_DIR,"src","data", "processed", "kpi_enriched_mq_dec_2024.parquet") # processor/enricher.py mq
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, "data", "snapshots")
+# Memory-mapped segments x hours matrices, read by the dashboard (VALUE_MATRIX_DIR) instead of snapshot documents
+DEFAULT_MATRIX_DIR = os.path.join(ROOT_DIR, "streamlit_app", "data", "value_matrix")
+
 
-# Load data and generate timestamp
-df = pd.read_parquet(DATA_PATH)
-df["timestamp"] = df["tag"].dt.strftime("%Y-%m-%d") + " " + df["hour"].astype(str).str.zfill(2) + ":00"
-unique_times = df["timestamp"].unique()
-
-KPI_COMBINATIONS = {
-    "all_number_of_vehicles": "q_kfz_det_hr",
-    "all_avg_speed": "v_kfz_det_hr",
-    "cars_number_of_vehicles": "q_pkw_det_hr",
-    "cars_avg_speed": "v_pkw_det_hr",
-    "trucks_number_of_vehicles": "q_lkw_det_hr",
-    "trucks_avg_speed": "v_lkw_det_hr",
-}
-
-# Prepare matcher once
-matcher = StreetMatcher()
-matcher.load_osm_network()
-
-print(f"Generating and saving {len(unique_times) * len(KPI_COMBINATIONS)} snapshots to MongoDB...")
-
-# Generate and save each snapshot
-for ts_str in unique_times:
-    df_ts_selected = df[df["timestamp"] == ts_str].copy()
-    
-    for combo_key, kpi_column_name in KPI_COMBINATIONS.items():
-        parts = combo_key.split('_', 1) # Split only on the first underscore
-        vehicle_type = parts[0]
-        kpi_type = parts[1]
-
-        # Ensure the KPI column exists in the filtered DataFrame for this timestamp
-        if kpi_column_name not in df_ts_selected.columns:
-            print(f"Warning: KPI column '{kpi_column_name}' not found for {ts_str}, combo '{combo_key}'. Skipping this combination.")
-            continue # Skip this snapshot if the required data column is missing
-        
-        gdf_matched = matcher.match_detectors_to_segments(df_ts_selected)
-        
-        # Aggregate the specific KPI column for this combination
+def create_sink(args):
+    if args.sink == "mongo":
+        # Establish MongoDB Connection
+        sink = MongoSnapshotSink(args.mongo_uri, DB_NAME, COLLECTION_NAME, TIMESERIES_COLLECTION_NAME,
+                                 CATALOG_COLLECTION_NAME, DISTRICT_COLLECTION_NAME, DISTRICT_BOUNDARY_COLLECTION_NAME,
+                                 level=args.level)
         try:
-            gdf_road_kpi = matcher.aggregate_kpi_by_osm_segment(gdf_matched,kpi_col=kpi_column_name)
-        except ValueError as e:
-            print(f"Error aggregating KPI for {ts_str}, combo '{combo_key}': {e}. Skipping.")
-            continue # Skip if aggregation fails (e.g., kpi_col not found in gdf_matched)
-        
-        # Simplify geometry for faster rendering
-        if 'geometry' in gdf_road_kpi.columns and not gdf_road_kpi['geometry'].empty:
-            gdf_road_kpi["geometry"] = gdf_road_kpi["geometry"].simplify(0.0001, preserve_topology=True)
-        else:
-            print(f"Warning: No valid geometry found for {ts_str}, combo '{combo_key}'. Skipping insertion.")
-            continue # Skip insertion if no geometry or empty GeoDataFrame
-        
-        # Convert to GeoJSON dictionary and prepare for MongoDB
-        if not gdf_road_kpi.empty:
-            geojson_dict = gdf_road_kpi.__geo_interface__ # This gives a dict suitable for GeoJSON spec
-            snapshot_document = {
-                "timestamp": ts_str,
-                "vehicle_type": vehicle_type,
-                "kpi_type": kpi_type,
-                "features": geojson_dict["features"] # Extract just the features list
-            }
-            # Insert into MongoDB
+            sink.connect()
+        except ValueError as e: # Collections holding the other level
+            print(f"Error: {e}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error connecting to MongoDB or delete many or creating index: {e}")
+            sys.exit(1) # Exit if cannot connect to DB
+        return sink
+
+    # Offline generation: no database needed, files are imported with load_snapshots.py
+    sink = FileSnapshotSink(args.output_dir, file_format=args.sink, overwrite=args.overwrite, level=args.level)
+    try:
+        sink.connect()
+    except FileExistsError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    return sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sink", choices=["mongo"] + list(FILE_FORMATS), default="mongo",
+                        help="Write to MongoDB, or to compressed NDJSON / Parquet files")
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for the file sinks")
+    parser.add_argument("--overwrite", action="store_true", help="Replace files from an earlier run in --output-dir")
+    parser.add_argument("--level", choices=["det", "mq"], default="det",
+                        help="Input rows per lane detector (det) or per measurement cross-section (mq, far fewer rows)")
+    parser.add_argument("--matrix-dir", default=None,
+                        help="Directory for the dashboard's value matrices (empty string to skip; "
+                             "default value_matrix/, value_matrix_mq/ for --level mq)")
+    args = parser.parse_args()
+    if args.matrix_dir is None:
+        args.matrix_dir = DEFAULT_MATRIX_DIR if args.level == "det" else f"{DEFAULT_MATRIX_DIR}_{args.level}"
+
+    sink = create_sink(args)
+
+    # Load data and generate timestamp
+    df = add_timestamp_column(pd.read_parquet(MQ_DATA_PATH if args.level == "mq" else DATA_PATH))
+    unique_times = df["timestamp"].unique()
+
+    # Prepare matcher once
+    matcher = StreetMatcher(tile_size=NETWORK_TILE_SIZE)
+    matcher.load_osm_network(points=df)
+
+    # Segment-major time series, filled alongside the hourly snapshots
+    timeseries_builder = SegmentTimeSeriesBuilder(geometry_precision=GEOMETRY_PRECISION)
+    # District aggregates (segments are assigned to districts once), shown by the dashboard when zoomed out.
+    # The boundaries come from Nominatim; without them the snapshots are still generated, just no district layer
+    district_index = DistrictIndex()
+    try:
+        district_index.load()
+        district_builder = DistrictSnapshotBuilder(district_index)
+    except Exception as e:
+        print(f"⚠️ Could not load the district boundaries, skipping the district aggregates: {e}")
+        district_builder = None
+    snapshot_builder = SnapshotBuilder(matcher, GEOMETRY_PRECISION, timeseries_builder, district_builder, level=args.level)
+
+    print(f"Generating and saving {len(unique_times) * len(kpi_combinations(args.level))} snapshots from {len(df)} {args.level} rows ({args.sink})...")
+
+    # Generate and save each snapshot
+    content_hashes = {} # (vehicle_type, kpi_type, timestamp) -> content hash, recorded with the value matrices
+    for ts_str in unique_times:
+        df_ts_selected = df[df["timestamp"] == ts_str].copy()
+
+        for snapshot_document in snapshot_builder.build(df_ts_selected, ts_str):
+            vehicle_type = snapshot_document["vehicle_type"]
+            kpi_type = snapshot_document["kpi_type"]
+            content_hashes[(vehicle_type, kpi_type, ts_str)] = snapshot_document["content_hash"]
             try:
-                existing = collection.find_one({
-                    "timestamp": ts_str,
-                    "vehicle_type": vehicle_type,
-                    "kpi_type": kpi_type
-                })
-                if existing:
-                    print(f"Skipping existing snapshot for {ts_str} | {vehicle_type} | {kpi_type}")
+                status = sink.write_snapshot(snapshot_document)
+                if status == "unchanged":
+                    print(f"Skipping unchanged snapshot for {ts_str} | {vehicle_type} | {kpi_type}")
                     continue
-                
-                collection.insert_one(snapshot_document)
-                print(f"Inserted snapshot for: {ts_str} | Vehicle: {vehicle_type} | KPI: {kpi_type}")
+                print(f"{status.capitalize()} snapshot for: {ts_str} | Vehicle: {vehicle_type} | KPI: {kpi_type}")
                 print("---------------------------------")
             except Exception as e:
-                print(f"Error inserting document for {ts_str}, combo '{combo_key}': {e}")
+                print(f"Error inserting document for {ts_str}, combo '{vehicle_type}_{kpi_type}': {e}")
                 print("---------------------------------")
-        else:
-            print(f"No data to insert for {ts_str}, combo '{combo_key}'. GeoDataFrame was empty after aggregation.")
 
-print("\nMongoDB data generation complete!")
-client.close() # Close connection when done
+    # Write the segment-major time series (one upsert per segment/KPI/month)
+    print(f"Writing {len(timeseries_builder)} segment time series...")
+    try:
+        sink.write_timeseries(timeseries_builder.documents())
+    except Exception as e:
+        print(f"Error writing segment time series: {e}")
+
+    # Same values as dense per-KPI matrices, so dashboard workers can share one memory-mapped copy
+    if args.matrix_dir:
+        try:
+            write_value_matrices(timeseries_builder.documents(), args.matrix_dir, content_hashes)
+        except Exception as e:
+            print(f"Error writing value matrices: {e}")
+
+    # Write the district aggregates and their boundaries (geometry is stored once, not per hour)
+    if district_builder is not None:
+        print(f"Writing {len(district_builder)} district snapshots...")
+        try:
+            sink.write_district_boundaries(district_index.boundary_documents(GEOMETRY_PRECISION))
+            sink.write_district_snapshots(district_builder.documents())
+        except Exception as e:
+            print(f"Error writing district snapshots: {e}")
+
+    # Publish the generated hours to the dashboard
+    sink.update_catalog(unique_times.tolist())
+
+    sink.close() # Close connection / finish the last files when done
+    print("\nData generation complete!")
+
+
+if __name__ == "__main__":
+    main()
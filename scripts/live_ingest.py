@@ -0,0 +1,160 @@
+"""
+Long-running ingest mode for newly published hourly detector data.
+
+Watches a drop directory (a local stand-in for the Berlin detection feed) for detector files in the
+det_val_hr CSV format (.csv or .csv.gz, any number of complete hours per file); with --level mq,
+cross-section (mq_val_hr) files are accepted too and detector files are collapsed to cross-sections. Each new file is
+enriched, matched and written as snapshots right away; the segment time series and the dashboard's
+timestamp catalog are updated for the new hours only, so earlier data is never reprocessed.
+
+Processed files are moved to <drop-dir>/processed (or <drop-dir>/failed), and their enriched rows
+are kept as one Parquet file per input file next to the monthly Parquet.
+
+Usage (from the scripts/ folder):
+    python live_ingest.py --drop-dir ../src/data/live/incoming
+"""
+import argparse
+import os
+import shutil
+import time
+
+from processor.kpi_loader import TrafficKPILoader
+from processor.enricher import TrafficDataEnricher
+from processor.osm_matcher import StreetMatcher
+from processor.timeseries import SegmentTimeSeriesBuilder
+from processor.districts import DistrictIndex, DistrictSnapshotBuilder
+from processor.snapshot_builder import SnapshotBuilder, add_timestamp_column
+from processor.snapshot_sink import MongoSnapshotSink
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+METADATA_PATH = os.path.join(ROOT_DIR, "src", "data", "raw", "Stammdaten_Verkehrsdetektion_2022_07_20.xlsx")
+DEFAULT_DROP_DIR = os.path.join(ROOT_DIR, "src", "data", "live", "incoming")
+ENRICHED_DIR = os.path.join(ROOT_DIR, "src", "data", "processed", "live")
+
+INPUT_SUFFIXES = (".csv", ".csv.gz")
+
+
+class LiveIngestor:
+    """
+    Enriches, matches and writes one dropped detector file at a time, reusing the loaded
+    road network, district boundaries and master data across files.
+    """
+
+    def __init__(self, sink: MongoSnapshotSink, matcher: StreetMatcher, enricher: TrafficDataEnricher,
+                 district_index: DistrictIndex = None, geometry_precision: int = 5, enriched_dir: str = ENRICHED_DIR):
+        self.sink = sink
+        self.level = enricher.level
+        self.matcher = matcher
+        self.enricher = enricher
+        self.district_index = district_index
+        self.geometry_precision = geometry_precision
+        self.enriched_dir = enriched_dir
+
+    def ingest_file(self, path: str) -> list:
+        started = time.perf_counter()
+        df_kpi = TrafficKPILoader(path).load()
+        df_enriched = add_timestamp_column(self.enricher.enrich_batch(df_kpi))
+        new_times = sorted(df_enriched["timestamp"].unique())
+
+        # Fresh builders per file: the time series only carry the new hours, which are merged slot-wise
+        timeseries_builder = SegmentTimeSeriesBuilder(geometry_precision=self.geometry_precision)
+        district_builder = DistrictSnapshotBuilder(self.district_index) if self.district_index is not None else None
+        snapshot_builder = SnapshotBuilder(self.matcher, self.geometry_precision, timeseries_builder, district_builder, self.level)
+
+        for ts_str in new_times:
+            df_ts_selected = df_enriched[df_enriched["timestamp"] == ts_str].copy()
+            for snapshot_document in snapshot_builder.build(df_ts_selected, ts_str):
+                status = self.sink.write_snapshot(snapshot_document)
+                print(f"{status.capitalize()} snapshot for: {ts_str} | Vehicle: {snapshot_document['vehicle_type']} | KPI: {snapshot_document['kpi_type']}")
+
+        self.sink.update_timeseries(timeseries_builder.documents())
+        if district_builder is not None:
+            self.sink.write_district_snapshots(district_builder.documents())
+        # Publishing to the catalog last makes the hours visible only once all their data is written
+        self.sink.update_catalog(new_times)
+
+        os.makedirs(self.enriched_dir, exist_ok=True)
+        base_name = os.path.basename(path).split(".")[0]
+        df_enriched.drop(columns=["timestamp"]).to_parquet(os.path.join(self.enriched_dir, f"{base_name}.parquet"), index=False)
+
+        print(f"✅ Ingested {os.path.basename(path)}: {len(new_times)} hour(s) in {time.perf_counter() - started:.1f}s")
+        return new_times
+
+
+def find_ready_files(drop_dir: str, settle_seconds: float) -> list:
+    """
+    Input files in the drop directory that have not been modified for settle_seconds
+    (so files still being written are left for the next poll).
+    """
+    now = time.time()
+    ready = []
+    for name in sorted(os.listdir(drop_dir)):
+        path = os.path.join(drop_dir, name)
+        if os.path.isfile(path) and name.endswith(INPUT_SUFFIXES) and now - os.path.getmtime(path) >= settle_seconds:
+            ready.append(path)
+    return ready
+
+
+def move_to(path: str, folder: str):
+    os.makedirs(folder, exist_ok=True)
+    shutil.move(path, os.path.join(folder, os.path.basename(path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drop-dir", default=DEFAULT_DROP_DIR, help="Directory watched for new detector files")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between directory scans")
+    parser.add_argument("--settle-seconds", type=float, default=1.0, help="Minimum file age before it is picked up")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db-name", default="traffic_dashboard")
+    parser.add_argument("--geometry-precision", type=int, default=5)
+    parser.add_argument("--tile-size", type=float, default=0.05,
+                        help="Road network tile size in degrees (0 loads the whole network as one graph)")
+    parser.add_argument("--level", choices=["det", "mq"], default="det",
+                        help="Process rows per lane detector (det) or per measurement cross-section (mq)")
+    parser.add_argument("--once", action="store_true", help="Process the files present now and exit")
+    args = parser.parse_args()
+
+    os.makedirs(args.drop_dir, exist_ok=True)
+    processed_dir = os.path.join(args.drop_dir, "processed")
+    failed_dir = os.path.join(args.drop_dir, "failed")
+
+    # Each level has its own collections, so det files never update the mq series and vice versa
+    sink = MongoSnapshotSink(args.mongo_uri, args.db_name, level=args.level)
+    sink.connect()
+
+    # Load the expensive shared state once; each new file then only costs its own hours
+    # Tiles are loaded on demand as files bring detectors in new areas
+    matcher = StreetMatcher(tile_size=args.tile_size or None)
+    matcher.load_osm_network()
+    enricher = TrafficDataEnricher(None, METADATA_PATH, level=args.level)
+    district_index = DistrictIndex()
+    try:
+        district_index.load()
+        sink.write_district_boundaries(district_index.boundary_documents(args.geometry_precision))
+    except Exception as e:
+        print(f"⚠️ Could not load the district boundaries, ingesting without district aggregates: {e}")
+        district_index = None
+    ingestor = LiveIngestor(sink, matcher, enricher, district_index, args.geometry_precision)
+
+    print(f"👀 Watching {args.drop_dir} for new detector files...")
+    try:
+        while True:
+            for path in find_ready_files(args.drop_dir, args.settle_seconds):
+                try:
+                    ingestor.ingest_file(path)
+                    move_to(path, processed_dir)
+                except Exception as e:
+                    print(f"❌ Failed to ingest {os.path.basename(path)}: {e}")
+                    move_to(path, failed_dir)
+            if args.once:
+                break
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("Stopping live ingest.")
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Bulk-loads the files written by generate_snapshot.py's file sinks (--sink ndjson/parquet) into MongoDB.
+
+Part files are imported in parallel, each in large unordered bulk batches; snapshots whose content
+hash is already in the database are skipped, so loading is repeatable. The timestamp catalog is
+updated last, so the dashboard only shows hours whose data is complete. Files generated with
+--level mq go to the _mq collections, as recorded in their catalog.
+
+Usage (from the scripts/ folder):
+    python load_snapshots.py --input-dir ../data/snapshots --mongo-uri mongodb://localhost:27017/ --workers 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from processor.snapshot_sink import MongoSnapshotSink, FILE_DATASETS, BULK_BATCH_SIZE, list_part_files, read_part_file, read_level
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_INPUT_DIR = os.path.join(ROOT_DIR, "data", "snapshots")
+
+
+def batches(documents, batch_size: int):
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_part_file(sink: MongoSnapshotSink, dataset: str, path: str, batch_size: int) -> int:
+    loaded = 0
+    for batch in batches(read_part_file(path), batch_size):
+        if dataset == "snapshots":
+            sink.write_snapshots(batch)
+        elif dataset == "timeseries":
+            sink.write_timeseries(batch)
+        elif dataset == "district_snapshots":
+            sink.write_district_snapshots(batch)
+        elif dataset == "district_boundaries":
+            sink.write_district_boundaries(batch)
+        elif dataset == "catalog":
+            for doc in batch:
+                sink.update_catalog(doc["timestamps"])
+        loaded += len(batch)
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-dir", default=DEFAULT_INPUT_DIR, help="Output directory of the file sink")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--db-name", default="traffic_dashboard")
+    parser.add_argument("--workers", type=int, default=4, help="Part files loaded in parallel")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE,
+                        help="Documents per bulk write (at most one part file; the file sink writes BULK_BATCH_SIZE per part)")
+    args = parser.parse_args()
+
+    sink = MongoSnapshotSink(args.mongo_uri, args.db_name, batch_size=args.batch_size, level=read_level(args.input_dir))
+    sink.connect()
+
+    started = time.perf_counter()
+    total = 0
+    try:
+        # Datasets one after another (updates after replacements, catalog last), part files in parallel
+        for dataset in FILE_DATASETS:
+            part_files = list_part_files(args.input_dir, dataset)
+            if not part_files:
+                continue
+            dataset_started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                counts = list(executor.map(lambda path: load_part_file(sink, dataset, path, args.batch_size), part_files))
+            total += sum(counts)
+            print(f"📦 Loaded {sum(counts)} {dataset} documents from {len(part_files)} file(s) "
+                  f"in {time.perf_counter() - dataset_started:.1f}s")
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Loaded {total} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
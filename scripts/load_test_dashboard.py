@@ -0,0 +1,461 @@
+"""
+Load test for the dashboard's data path: simulates concurrent viewer sessions running the
+interaction sequences of streamlit_app/Home.py (open the map, change the vehicle type, change the
+time range, start the animation) with the app's own data-loading and map-building functions.
+
+Sessions run as threads of one process, like Streamlit sessions do, so the reported memory is
+the server's. Reports p50/p95/p99 latency per step, process memory and database operations per second.
+
+Usage (from the scripts/ folder):
+    python load_test_dashboard.py --sessions 20 --interactions 10
+    python load_test_dashboard.py --in-process --sessions 50   # mongomock stand-in with synthetic data
+    python load_test_dashboard.py --in-process --matrix-dir "" # MongoDB frames only, to compare with the matrix path
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pymongo import monitoring
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT_DIR, "streamlit_app"))
+
+import data_access # The dashboard's modules (streamlit_app/ is not a package)
+from map_html import create_map_html
+from processor.geometry_codec import encode_geometry
+from processor.snapshot_builder import KPI_COMBINATIONS, compute_content_hash
+from processor.timeseries import month_key, hours_in_month, hour_offset
+from processor.value_matrix import write_value_matrices
+
+# Collection names as configured for the dashboard (same environment variables as Home.py)
+COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME", "road_kpi_snapshots")
+CATALOG_COLLECTION_NAME = os.getenv("MONGO_CATALOG_COLLECTION_NAME", "snapshot_catalog")
+DISTRICT_COLLECTION_NAME = os.getenv("MONGO_DISTRICT_COLLECTION_NAME", "road_kpi_district_snapshots")
+DISTRICT_BOUNDARY_COLLECTION_NAME = os.getenv("MONGO_DISTRICT_BOUNDARY_COLLECTION_NAME", "district_boundaries")
+
+VEHICLE_TYPES = ["all", "cars", "trucks"]
+KPI_TYPES = ["number_of_vehicles", "avg_speed"]
+ACTIONS = ["change_vehicle_type", "change_range", "start_animation"]
+
+
+class LatencyRecorder:
+    """
+    Collects step durations from all sessions (thread-safe).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.html_bytes = []
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.durations.setdefault(name, []).append(elapsed_ms)
+
+    def add_html_size(self, size: int):
+        with self._lock:
+            self.html_bytes.append(size)
+
+    def summary(self) -> pd.DataFrame:
+        rows = []
+        for name, values in self.durations.items():
+            values = np.array(values)
+            rows.append({
+                "step": name,
+                "count": len(values),
+                "p50_ms": np.percentile(values, 50),
+                "p95_ms": np.percentile(values, 95),
+                "p99_ms": np.percentile(values, 99),
+                "max_ms": values.max(),
+            })
+        return pd.DataFrame(rows).set_index("step")
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Counts database commands sent by the app's MongoClient (find, getMore, aggregate, ...).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+    def started(self, event):
+        self.increment()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class MemorySampler(threading.Thread):
+    """
+    Samples the resident memory of this process while the sessions run.
+    """
+
+    def __init__(self, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(current_rss_mb())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def current_rss_mb() -> float:
+    if sys.platform == "win32":
+        return _windows_rss_mb()
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        # No /proc (e.g. macOS): fall back to the peak, reported in bytes there
+        import resource # Unix only
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _windows_rss_mb() -> float:
+    # Working set of this process, via the Win32 API (no extra dependency)
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi = ctypes.WinDLL("psapi")
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+    return counters.WorkingSetSize / 1024 ** 2
+
+
+class ViewerSession:
+    """
+    One simulated dashboard viewer. Each interaction is one full run of Home.py's animation path,
+    with a browser frame cache that keeps the frames already sent (keyed by content hash).
+
+    Like Home.py, the server starts out assuming the browser has every frame (client_frame_hashes is None);
+    the browser then reports its cache, and if frames are missing the app reruns to send them.
+    """
+
+    def __init__(self, args, recorder: LatencyRecorder, seed: int):
+        self.args = args
+        self.recorder = recorder
+        self.rng = random.Random(seed)
+        self.browser_hashes = set()  # The browser's frame cache (IndexedDB), empty for a new viewer
+        self.client_frame_hashes = None  # What the server knows about it (Home.py's session state)
+        self.vehicle_type = "all"
+        self.kpi_type = "number_of_vehicles"
+        self.auto_playing = False
+        self.range_days = None  # None = the whole available range (Home.py's default)
+
+    def rerun(self) -> bool:
+        """
+        One run of Home.py; returns True if the browser then reports missing frames (Home.py reruns).
+        """
+        args = self.args
+        with self.recorder.step("available_times"):
+            unique_times = sorted(data_access.load_available_times(
+                args.mongo_uri, args.db_name, COLLECTION_NAME, CATALOG_COLLECTION_NAME))
+        times_for_query = self._times_in_range(unique_times)
+
+        with self.recorder.step("frame_manifest"):
+            frame_manifest = data_access.load_frame_manifest(
+                args.mongo_uri, args.db_name, COLLECTION_NAME, self.vehicle_type, self.kpi_type, times_for_query)
+
+        with self.recorder.step("district_values"):
+            district_boundaries = data_access.load_district_boundaries(
+                args.mongo_uri, args.db_name, DISTRICT_BOUNDARY_COLLECTION_NAME)
+            district_values = data_access.load_district_values(
+                args.mongo_uri, args.db_name, DISTRICT_COLLECTION_NAME, self.vehicle_type, self.kpi_type, times_for_query
+            ) if district_boundaries["features"] else None
+
+        if self.client_frame_hashes is None:
+            times_to_fetch = [ts for ts, content_hash in frame_manifest.items() if content_hash is None]
+        else:
+            times_to_fetch = [ts for ts, content_hash in frame_manifest.items()
+                              if content_hash is None or content_hash not in self.client_frame_hashes]
+        all_geojson_data = {}
+        if times_to_fetch and args.matrix_dir:
+            # Home.py slices frames from the shared memory-mapped value matrix first
+            with self.recorder.step("value_matrix_frames"):
+                value_matrix = data_access.load_value_matrix(
+                    args.matrix_dir, self.vehicle_type, self.kpi_type, data_access.value_matrix_generation(args.matrix_dir))
+                if value_matrix is not None:
+                    all_geojson_data = value_matrix.frames({ts: frame_manifest[ts] for ts in times_to_fetch})
+                    times_to_fetch = [ts for ts in times_to_fetch if ts not in all_geojson_data]
+        if times_to_fetch:
+            with self.recorder.step("snapshot_frames"):
+                all_geojson_data.update(data_access.load_snapshots_from_mongodb(
+                    args.mongo_uri, args.db_name, COLLECTION_NAME, self.vehicle_type, self.kpi_type, times_to_fetch))
+        sent_hashes = {frame_manifest[ts] for ts in all_geojson_data if frame_manifest.get(ts)}
+        if self.client_frame_hashes is not None:
+            self.client_frame_hashes.update(sent_hashes)
+
+        available_times = list(frame_manifest)
+        with self.recorder.step("map_html"):
+            map_html = create_map_html(
+                geojson_data_all_times=all_geojson_data,
+                available_times_list=available_times,
+                start_idx=0,
+                end_idx=max(len(available_times) - 1, 0),
+                speed_ms=500,
+                initial_current_idx=0,
+                auto_play_on_load=self.auto_playing,
+                frame_hashes={ts: content_hash for ts, content_hash in frame_manifest.items() if content_hash},
+                district_boundaries=district_boundaries,
+                district_values=district_values
+            )
+        self.recorder.add_html_size(len(map_html))
+
+        # The map stores the sent frames, reads the others from its cache and reports back (syncFrameCache)
+        self.browser_hashes.update(sent_hashes)
+        missing = [content_hash for ts, content_hash in frame_manifest.items()
+                   if content_hash and ts not in all_geojson_data and content_hash not in self.browser_hashes]
+        self.client_frame_hashes = set(self.browser_hashes)
+        return bool(missing)
+
+    def _times_in_range(self, unique_times: list) -> list:
+        if self.range_days is None:
+            return unique_times
+        start_day, end_day = self.range_days
+        return [ts for ts in unique_times if start_day <= ts[:10] <= end_day]
+
+    def apply(self, action: str, unique_days: list):
+        if action == "change_vehicle_type":
+            self.vehicle_type = self.rng.choice([v for v in VEHICLE_TYPES if v != self.vehicle_type])
+            self.kpi_type = self.rng.choice(KPI_TYPES)
+            self.auto_playing = False
+        elif action == "change_range":
+            start = self.rng.randrange(len(unique_days))
+            end = min(len(unique_days) - 1, start + self.rng.randrange(self.args.max_range_days))
+            self.range_days = (unique_days[start], unique_days[end])
+            self.auto_playing = False
+        elif action == "start_animation":
+            self.auto_playing = True
+
+    def interact(self):
+        with self.recorder.step("interaction"):
+            if self.rerun():
+                self.rerun()  # Send the frames the browser reported missing
+
+    def run(self, unique_days: list):
+        self.interact()  # Opening the dashboard
+        for _ in range(self.args.interactions):
+            time.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+            self.apply(self.rng.choice(ACTIONS), unique_days)
+            self.interact()
+
+
+def seed_synthetic_data(db, segments: int, days: int, precision: int = 5, matrix_dir: str = None):
+    """
+    Fills an in-process database with frames shaped like the generator's output
+    (and writes the matching value matrices to matrix_dir, if given).
+    """
+    rng = random.Random(0)
+    times = [ts.strftime("%Y-%m-%d %H:00") for ts in pd.date_range("2024-12-01", periods=days * 24, freq="h")]
+    geometries = []
+    for _ in range(segments):
+        lon, lat = rng.uniform(13.1, 13.7), rng.uniform(52.35, 52.65)
+        coordinates = [[lon + i * 0.0005, lat + rng.uniform(-0.0003, 0.0003)] for i in range(rng.randint(2, 8))]
+        geometries.append(encode_geometry({"type": "LineString", "coordinates": coordinates}, precision))
+
+    districts = [f"District {i + 1}" for i in range(12)]
+    db[DISTRICT_BOUNDARY_COLLECTION_NAME].insert_many([
+        {"district": name, "geometry": encode_geometry({"type": "Polygon", "coordinates": [[
+            [13.1 + i * 0.05, 52.35], [13.15 + i * 0.05, 52.35], [13.15 + i * 0.05, 52.65], [13.1 + i * 0.05, 52.65], [13.1 + i * 0.05, 52.35]
+        ]]}, precision)}
+        for i, name in enumerate(districts)
+    ])
+
+    timeseries_documents, content_hashes = {}, {}
+    for combo_key in KPI_COMBINATIONS:
+        vehicle_type, kpi_type = combo_key.split('_', 1)
+        snapshots, district_snapshots = [], []
+        for ts in times:
+            features = [
+                {"type": "Feature", "id": str(i), "geometry": geometry,
+                 "properties": {"segment_id": f"{i}-{i + 1}-0", "name_road_segment": f"Street {i}", "value": rng.uniform(0, 1500)}}
+                for i, geometry in enumerate(geometries)
+            ]
+            snapshots.append({"timestamp": ts, "vehicle_type": vehicle_type, "kpi_type": kpi_type,
+                              "features": features, "content_hash": compute_content_hash(features)})
+            content_hashes[(vehicle_type, kpi_type, ts)] = snapshots[-1]["content_hash"]
+            if matrix_dir:
+                hour = pd.Timestamp(ts)
+                for feature in features:
+                    properties = feature["properties"]
+                    key = (properties["segment_id"], vehicle_type, kpi_type, month_key(hour))
+                    record = timeseries_documents.setdefault(key, {
+                        "segment_id": properties["segment_id"], "vehicle_type": vehicle_type, "kpi_type": kpi_type,
+                        "month": month_key(hour), "name_road_segment": properties["name_road_segment"],
+                        "geometry": feature["geometry"], "values": [None] * hours_in_month(hour)})
+                    record["values"][hour_offset(hour)] = properties["value"]
+            district_snapshots.append({"timestamp": ts, "vehicle_type": vehicle_type, "kpi_type": kpi_type,
+                                       "districts": {name: {"value": rng.uniform(0, 1500), "segment_count": 10} for name in districts}})
+        db[COLLECTION_NAME].insert_many(snapshots)
+        db[DISTRICT_COLLECTION_NAME].insert_many(district_snapshots)
+
+    db[CATALOG_COLLECTION_NAME].insert_one({"_id": "timestamps", "timestamps": times, "latest_timestamp": times[-1]})
+    if matrix_dir:
+        write_value_matrices(list(timeseries_documents.values()), matrix_dir, content_hashes)
+
+
+def use_in_process_database(args, counter: CommandCounter):
+    """
+    Points the dashboard's data access at a mongomock database with synthetic data. mongomock does not
+    emit command events, so collection reads are counted directly.
+    """
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("--in-process needs mongomock (pip install mongomock)")
+
+    client = mongomock.MongoClient()
+    if args.matrix_dir:
+        # Matrices for the synthetic data, never written over the app's own
+        args.matrix_dir = tempfile.mkdtemp(prefix="value_matrix_")
+    print(f"🧪 Seeding in-process database: {args.synthetic_segments} segments x {args.synthetic_days * 24} hours...")
+    seed_synthetic_data(client[args.db_name], args.synthetic_segments, args.synthetic_days, matrix_dir=args.matrix_dir)
+
+    for method_name in ["find", "find_one", "aggregate", "distinct"]:
+        original = getattr(mongomock.collection.Collection, method_name)
+
+        def counted(self, *a, _original=original, **k):
+            counter.increment()
+            return _original(self, *a, **k)
+        setattr(mongomock.collection.Collection, method_name, counted)
+
+    data_access.MongoClient = lambda *a, **k: client
+
+
+def quiet_streamlit_logging():
+    # The data functions use st.cache_*/st.warning, which log "no runtime" warnings outside `streamlit run`
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent viewer sessions")
+    parser.add_argument("--interactions", type=int, default=5, help="Interactions per session after opening the map")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between interactions")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which sessions are started")
+    parser.add_argument("--max-range-days", type=int, default=7, help="Longest time range picked by 'change range'")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--db-name", default=os.getenv("MONGO_DB_NAME", "traffic_dashboard"))
+    parser.add_argument("--in-process", action="store_true", help="Use an in-process mongomock database with synthetic data")
+    parser.add_argument("--synthetic-segments", type=int, default=300)
+    parser.add_argument("--synthetic-days", type=int, default=3)
+    parser.add_argument("--matrix-dir", default=data_access.VALUE_MATRIX_DIR,
+                        help="Value matrices read before MongoDB, like Home.py (empty string: MongoDB only)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON, e.g. to compare runs before deploying")
+    args = parser.parse_args()
+
+    quiet_streamlit_logging()
+    counter = CommandCounter()
+    if args.in_process:
+        use_in_process_database(args, counter)
+    else:
+        monitoring.register(counter)  # Before the app's MongoClient is created
+
+    unique_days = sorted({ts[:10] for ts in data_access.load_available_times(
+        args.mongo_uri, args.db_name, COLLECTION_NAME, CATALOG_COLLECTION_NAME)})
+    if not unique_days:
+        raise SystemExit("No timestamps found; generate snapshots first or use --in-process")
+
+    recorder = LatencyRecorder()
+    sampler = MemorySampler()
+    baseline_rss = current_rss_mb()
+    ops_before = counter.count
+    print(f"🚦 Running {args.sessions} sessions x {args.interactions + 1} interactions...")
+
+    sampler.start()
+    started = time.perf_counter()
+    errors = []
+
+    def run_session(session_index: int):
+        time.sleep(args.ramp_up * session_index / max(args.sessions, 1))
+        try:
+            ViewerSession(args, recorder, args.seed + session_index).run(unique_days)
+        except Exception as e:
+            errors.append(e)
+
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        list(executor.map(run_session, range(args.sessions)))
+    duration = time.perf_counter() - started
+    sampler.stop()
+    if args.in_process and args.matrix_dir:
+        shutil.rmtree(args.matrix_dir, ignore_errors=True)
+
+    df_results = recorder.summary()
+    db_ops = counter.count - ops_before
+    interaction_count = int(df_results.loc["interaction", "count"]) if "interaction" in df_results.index else 0
+    summary = {
+        "sessions": args.sessions,
+        "value_matrix_dir": args.matrix_dir or "-",
+        "duration_s": duration,
+        "interactions_per_s": interaction_count / duration,
+        "db_ops": db_ops,
+        "db_ops_per_s": db_ops / duration,
+        "rss_baseline_mb": baseline_rss,
+        "rss_peak_mb": max(sampler.samples + [baseline_rss]),
+        "html_median_mb": float(np.median(recorder.html_bytes)) / 1024 ** 2 if recorder.html_bytes else 0.0,
+        "errors": len(errors),
+    }
+
+    print(df_results.round(1).to_string())
+    print()
+    for key, value in summary.items():
+        print(f"{key:>20}: {value:.2f}" if isinstance(value, float) else f"{key:>20}: {value}")
+    if errors:
+        print(f"❌ {len(errors)} session(s) failed, first error: {errors[0]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "steps": df_results.reset_index().to_dict(orient="records")}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import pandas as pd
+import geopandas as gpd
+import osmnx as ox
+from shapely.geometry import mapping
+from processor.geometry_codec import encode_geometry
+
+# The twelve Berlin districts (Bezirke), as found by Nominatim
+BERLIN_DISTRICTS = [
+    "Charlottenburg-Wilmersdorf",
+    "Friedrichshain-Kreuzberg",
+    "Lichtenberg",
+    "Marzahn-Hellersdorf",
+    "Mitte",
+    "Neukölln",
+    "Pankow",
+    "Reinickendorf",
+    "Spandau",
+    "Steglitz-Zehlendorf",
+    "Tempelhof-Schöneberg",
+    "Treptow-Köpenick",
+]
+
+
+class DistrictIndex:
+    """
+    District boundaries plus a segment -> district assignment. Each road segment is assigned
+    (by its representative point) the first time it is seen and looked up afterwards.
+    """
+
+    def __init__(self, city="Berlin, Germany", district_names=BERLIN_DISTRICTS):
+        self.city = city
+        self.district_names = district_names
+        self.districts = None
+        self._segment_districts = {}  # segment_id -> district name (None if outside all districts)
+
+    def load(self):
+        # Geocoding results are cached by osmnx under cache/, like the city boundary
+        print(f"🌐 Loading {len(self.district_names)} district boundaries from Nominatim...")
+        gdf = ox.geocode_to_gdf([f"{name}, {self.city}" for name in self.district_names])
+        gdf["district"] = self.district_names
+        self.districts = gdf[["district", "geometry"]].to_crs("EPSG:4326")
+
+    def assign(self, gdf_segments: gpd.GeoDataFrame) -> pd.Series:
+        """
+        District name for each row of gdf_segments (segment_id and geometry columns), aligned to its index.
+        """
+        if self.districts is None:
+            self.load()
+
+        new_segments = gdf_segments.loc[~gdf_segments["segment_id"].isin(self._segment_districts.keys()),
+                                        ["segment_id", "geometry"]].drop_duplicates("segment_id")
+        if not new_segments.empty:
+            points = gpd.GeoDataFrame(
+                {"segment_id": new_segments["segment_id"].values},
+                geometry=new_segments.geometry.representative_point().values,
+                crs=gdf_segments.crs
+            )
+            joined = gpd.sjoin(points, self.districts, how="left", predicate="within")
+            joined = joined.drop_duplicates("segment_id")  # Points on a shared border match twice
+            for segment_id, district in zip(joined["segment_id"], joined["district"]):
+                self._segment_districts[segment_id] = district if pd.notnull(district) else None
+
+        return gdf_segments["segment_id"].map(self._segment_districts)
+
+    def boundary_documents(self, geometry_precision: int = 5, simplify_tolerance: float = 0.0005) -> list:
+        if self.districts is None:
+            self.load()
+        return [
+            {
+                "district": row.district,
+                "geometry": encode_geometry(mapping(row.geometry.simplify(simplify_tolerance, preserve_topology=True)),
+                                            geometry_precision)
+            }
+            for row in self.districts.itertuples(index=False)
+        ]
+
+
+class DistrictSnapshotBuilder:
+    """
+    Collects hourly per-district aggregates of the segment values: one small record per
+    (hour, vehicle type, KPI) holding the mean segment value and segment count of each district.
+    District geometry is not repeated here; it is stored once with the boundaries.
+    """
+
+    def __init__(self, district_index: DistrictIndex):
+        self.district_index = district_index
+        self._documents = []
+
+    def add(self, ts_str: str, vehicle_type: str, kpi_type: str, gdf_road_kpi: gpd.GeoDataFrame):
+        districts = self.district_index.assign(gdf_road_kpi)
+        grouped = gdf_road_kpi["value"].groupby(districts).agg(["mean", "count"])
+        self._documents.append({
+            "timestamp": ts_str,
+            "vehicle_type": vehicle_type,
+            "kpi_type": kpi_type,
+            "districts": {
+                district: {"value": float(row["mean"]), "segment_count": int(row["count"])}
+                for district, row in grouped.iterrows() if row["count"] > 0
+            }
+        })
+
+    def documents(self) -> list:
+        return self._documents
+
+    def __len__(self):
+        return len(self._documents)
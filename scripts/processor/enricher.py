@@ -1,24 +1,47 @@
 import pandas as pd
 import os
-from kpi_loader import TrafficKPILoader
+import sys
+try:
+    from processor.kpi_loader import TrafficKPILoader # Imported from scripts/ (e.g. live_ingest.py)
+except ImportError:
+    from kpi_loader import TrafficKPILoader # Run directly from scripts/processor/
+
+# (count, speed) column stems per vehicle class
+KPI_PAIRS = [("q_kfz", "v_kfz"), ("q_pkw", "v_pkw"), ("q_lkw", "v_lkw")]
 
 
 class TrafficDataEnricher:
-    def __init__(self, df_kpi: pd.DataFrame, metadata_path: str, sheet: str = "Stammdaten_TEU_20220720"):
+    """
+    Adds locations and street names from the master data to the KPI rows.
+
+    level="det" keeps one row per lane-level detector. level="mq" produces one row per measurement
+    cross-section (MQ) instead, located at the mean position of its detectors: cross-section files
+    are used as they are, detector files are collapsed to cross-sections first (DET_ID15 -> MQ_ID15).
+    """
+
+    def __init__(self, df_kpi: pd.DataFrame, metadata_path: str, sheet: str = "Stammdaten_TEU_20220720",
+                 level: str = "det"):
+        if level not in ("det", "mq"):
+            raise ValueError(f"Unknown level '{level}', expected 'det' or 'mq'")
         self.df_kpi = df_kpi
         self.metadata_path = metadata_path
         self.sheet = sheet
+        self.level = level
         self.df_metadata = None
         self.df_enriched = None
         
     def _load_metadata(self):
         self.df_metadata = pd.read_excel(self.metadata_path, sheet_name=self.sheet)
+        self.df_metadata = self.df_metadata.rename(columns={"DET_ID15": "detid_15"})
 
     def enrich(self) -> pd.DataFrame:
-        self._load_metadata()
+        # The workbook is only read once, so one enricher can serve many incoming batches
+        if self.df_metadata is None:
+            self._load_metadata()
+        if self.level == "mq":
+            return self._enrich_cross_sections()
 
         # Join by detector ID
-        self.df_metadata = self.df_metadata.rename(columns={"DET_ID15": "detid_15"})
         self.df_enriched = pd.merge(self.df_kpi, self.df_metadata, on="detid_15", how="left")
 
         # Drop any detectors with no location
@@ -28,19 +51,77 @@ class TrafficDataEnricher:
 
         return self.df_enriched
 
-def main():
+    def enrich_batch(self, df_kpi: pd.DataFrame) -> pd.DataFrame:
+        self.df_kpi = df_kpi
+        return self.enrich()
+
+    # --- Measurement cross-sections ---
+    def _cross_section_metadata(self) -> pd.DataFrame:
+        located = self.df_metadata.dropna(subset=["LÄNGE (WGS84)", "BREITE (WGS84)"])
+        df_mq = located.groupby("MQ_ID15").agg(
+            MQ_KURZNAME=("MQ_KURZNAME", "first"),
+            STRASSE=("STRASSE", "first"),
+            RICHTUNG=("RICHTUNG", "first"),
+            lon=("LÄNGE (WGS84)", "mean"),
+            lat=("BREITE (WGS84)", "mean")
+        ).reset_index()
+        return df_mq
+
+    def _collapse_to_cross_sections(self, df_kpi: pd.DataFrame) -> pd.DataFrame:
+        """
+        Aggregates detector rows to cross-section rows the way the published cross-section data is built:
+        counts are summed, speeds weighted by the counts, and an hour only gets a value if every
+        detector of the cross-section reported it.
+        """
+        # A few detectors have several master data rows, always with the same cross-section
+        detector_mq = self.df_metadata[["detid_15", "MQ_ID15"]].drop_duplicates("detid_15")
+        df = df_kpi.merge(detector_mq, on="detid_15", how="inner")
+        for q, v in KPI_PAIRS:
+            df[f"{v}_weighted"] = df[f"{v}_det_hr"] * df[f"{q}_det_hr"] # -1 (no vehicles) only comes with a count of 0
+
+        grouped = df.groupby(["MQ_ID15", "tag", "hour"])
+        sums = grouped[[f"{q}_det_hr" for q, _ in KPI_PAIRS] + [f"{v}_weighted" for _, v in KPI_PAIRS]].sum()
+        detectors_reporting = grouped["detid_15"].nunique()
+        detectors_expected = self.df_metadata.groupby("MQ_ID15")["detid_15"].nunique()
+        complete = detectors_reporting.values >= detectors_expected.reindex(sums.index.get_level_values("MQ_ID15")).values
+
+        df_mq = pd.DataFrame(index=sums.index)
+        df_mq["qualitaet"] = grouped["qualitaet"].min()
+        for q, v in KPI_PAIRS:
+            df_mq[f"{q}_mq_hr"] = sums[f"{q}_det_hr"]
+            df_mq[f"{v}_mq_hr"] = (sums[f"{v}_weighted"] / sums[f"{q}_det_hr"]).where(sums[f"{q}_det_hr"] > 0)
+        return df_mq[complete].reset_index()
+
+    def _enrich_cross_sections(self) -> pd.DataFrame:
+        if "mq_name" in self.df_kpi.columns:
+            # Cross-section file: mq_name is either the numeric MQ_ID15 or the short name
+            key = "MQ_ID15" if pd.api.types.is_numeric_dtype(self.df_kpi["mq_name"]) else "MQ_KURZNAME"
+            df_mq = self.df_kpi.rename(columns={"mq_name": key})
+            if key == "MQ_KURZNAME":
+                df_mq = df_mq.merge(self._cross_section_metadata()[["MQ_ID15", "MQ_KURZNAME"]], on="MQ_KURZNAME", how="inner")
+                df_mq = df_mq.drop(columns=["MQ_KURZNAME"])
+        else:
+            df_mq = self._collapse_to_cross_sections(self.df_kpi)
+
+        # Cross-sections without a location are dropped (inner join)
+        self.df_enriched = pd.merge(df_mq, self._cross_section_metadata(), on="MQ_ID15", how="inner")
+        return self.df_enriched
+
+def main(level: str = "det"):
     ROOT_DIR = os.path.abspath(os.path.join(os.getcwd(), "......",))
     metadata_path = os.path.join(ROOT_DIR, "src", "data", "raw", "Stammdaten_Verkehrsdetektion_2022_07_20.xlsx")
     kpi_path = os.path.join(ROOT_DIR, "src", "data", "raw", "2024", "det_val_hr_2024_12.csv.gz")
 
     df_kpi = TrafficKPILoader(kpi_path).load()
-    enricher = TrafficDataEnricher(df_kpi, metadata_path)
+    enricher = TrafficDataEnricher(df_kpi, metadata_path, level=level)
     enriched_df = enricher.enrich()
     
     print(enriched_df.info())
     print(enriched_df.head())
     
-    enriched_df.to_parquet(os.path.join(ROOT_DIR, "src", "data", "processed", "kpi_enriched_dec_2024.parquet"), index=False)
+    # Cross-section output goes to its own file (kpi_enriched_mq_dec_2024.parquet)
+    file_name = "kpi_enriched_dec_2024.parquet" if level == "det" else f"kpi_enriched_{level}_dec_2024.parquet"
+    enriched_df.to_parquet(os.path.join(ROOT_DIR, "src", "data", "processed", file_name), index=False)
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else "det") # python enricher.py [det|mq]
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Compact geometry encoding for snapshot documents.
+
+Coordinates are quantized to 10^-precision degrees (precision 5 is about 1 m at Berlin's latitude)
+and delta-encoded with the Google encoded polyline algorithm, in its standard (lat, lon) order.
+Encoded geometries keep the GeoJSON nesting, with one polyline string per coordinate sequence:
+
+    {"type": "EncodedLineString", "precision": 5, "coordinates": "_p~iF~ps|U_ulLnnqC"}
+
+The map decodes them back to GeoJSON in the browser (decodeGeometry in streamlit_app/map_html.py).
+"""
+
+DEFAULT_PRECISION = 5
+
+# Nesting depth of coordinate sequences per GeoJSON type (0 = the coordinates are one sequence)
+_SEQUENCE_DEPTH = {
+    "LineString": 0,
+    "MultiLineString": 1,
+    "Polygon": 1,
+    "MultiPolygon": 2,
+}
+
+
+def _encode_value(value: int) -> str:
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def encode_polyline(coords, precision: int = DEFAULT_PRECISION) -> str:
+    """Encodes a sequence of GeoJSON (lon, lat[, z]) positions; z is dropped."""
+    factor = 10 ** precision
+    output = []
+    prev_lat = prev_lon = 0
+    for position in coords:
+        lat = int(round(position[1] * factor))
+        lon = int(round(position[0] * factor))
+        output.append(_encode_value(lat - prev_lat))
+        output.append(_encode_value(lon - prev_lon))
+        prev_lat, prev_lon = lat, lon
+    return "".join(output)
+
+
+def decode_polyline(encoded: str, precision: int = DEFAULT_PRECISION) -> list:
+    """Decodes a polyline string back into GeoJSON [lon, lat] positions."""
+    factor = 10 ** precision
+    coords = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append([lon / factor, lat / factor])
+    return coords
+
+
+def _map_sequences(coordinates, depth: int, func):
+    if depth == 0:
+        return func(coordinates)
+    return [_map_sequences(part, depth - 1, func) for part in coordinates]
+
+
+def encode_geometry(geometry: dict, precision: int = DEFAULT_PRECISION) -> dict:
+    """
+    Encodes a GeoJSON geometry dict. Types without coordinate sequences (e.g. Point) and a precision
+    of None leave the geometry unchanged.
+    """
+    if precision is None or geometry is None or geometry["type"] not in _SEQUENCE_DEPTH:
+        return geometry
+    depth = _SEQUENCE_DEPTH[geometry["type"]]
+    return {
+        "type": "Encoded" + geometry["type"],
+        "precision": precision,
+        "coordinates": _map_sequences(geometry["coordinates"], depth, lambda seq: encode_polyline(seq, precision)),
+    }
+
+
+def decode_geometry(geometry: dict) -> dict:
+    """Inverse of encode_geometry; plain GeoJSON geometries are returned unchanged."""
+    if geometry is None or not geometry["type"].startswith("Encoded"):
+        return geometry
+    geometry_type = geometry["type"][len("Encoded"):]
+    precision = geometry["precision"]
+    return {
+        "type": geometry_type,
+        "coordinates": _map_sequences(
+            geometry["coordinates"], _SEQUENCE_DEPTH[geometry_type], lambda seq: decode_polyline(seq, precision)
+        ),
+    }
@@ -2,6 +2,11 @@ import pandas as pd
 
 
 class TrafficKPILoader:
+    """
+    Loads one monthly traffic detection CSV: either lane-level detector values (detid_15, *_det_hr)
+    or measurement cross-section values (mq_name, *_mq_hr).
+    """
+
     def __init__(self, csv_path: str):
         self.csv_path = csv_path
         self.df = None
@@ -15,4 +20,4 @@ class TrafficKPILoader:
     def load(self) -> pd.DataFrame:
         self.df = pd.read_csv(self.csv_path, sep=';')
         self._clean()
-        return self.df
\ No newline at end of file
+        return self.df
@@ -1,23 +1,49 @@
 import os
+import math
 import pandas as pd
 import geopandas as gpd
 import osmnx as ox
+from osmnx._errors import InsufficientResponseError
 from shapely.geometry import Point
 
 
 class StreetMatcher:
-    def __init__(self, network_place="Berlin, Germany", cache_path=None):
+    """
+    Matches detectors to the nearest OSM road segment.
+
+    By default the whole network of network_place is loaded as one graph. With tile_size (degrees),
+    the network is instead split into a grid of tiles, each downloaded and cached on disk on its own;
+    only tiles containing detectors (plus tile_neighbours rings around them) are loaded, so memory
+    and startup scale with detector coverage rather than with the area of the region.
+    """
+
+    def __init__(self, network_place="Berlin, Germany", cache_path=None, tile_size=None,
+                 tile_cache_dir=None, tile_neighbours=1):
+        # Always resolve paths relative to the project root
+        osm_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "osm"))
         if cache_path is None:
-            # Always resolve path relative to the project root
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            cache_path = os.path.abspath(
-                os.path.join(script_dir, "..", "..", "data", "osm", "berlin_drive.graphml")
-            )
+            cache_path = os.path.join(osm_dir, "berlin_drive.graphml")
+        if tile_cache_dir is None and tile_size is not None:
+            # "_all": tiles keep every connected component (caches from before that are not reused)
+            tile_cache_dir = os.path.join(osm_dir, f"tiles_{tile_size}_all")
         self.network_place = network_place
         self.cache_path = cache_path
+        self.tile_size = tile_size
+        self.tile_cache_dir = tile_cache_dir
+        self.tile_neighbours = tile_neighbours
+        self._tile_edges = {}  # (ix, iy) -> edges of that tile (None if the tile has no roads)
+        self._location_segments = {}  # (lon, lat) -> osm_id_index of the nearest segment
+        self._osm_edges_proj = None
         self.osm_edges = None
 
-    def load_osm_network(self):
+    def load_osm_network(self, points: pd.DataFrame = None):
+        if self.tile_size is not None:
+            # Tiled mode: load the tiles around the given detector locations (lon/lat columns) now,
+            # further tiles are loaded on demand when matching
+            if points is not None:
+                self.load_tiles_for_points(points)
+            return
+
         if os.path.exists(self.cache_path):
             print("📂 Loading cached Berlin road network...")
             G = ox.load_graphml(self.cache_path)
@@ -26,10 +52,74 @@ class StreetMatcher:
             G = ox.graph_from_place(self.network_place, network_type='drive')
             ox.save_graphml(G, filepath=self.cache_path)
 
-        self.osm_edges = ox.graph_to_gdfs(G, nodes=False)
-        self.osm_edges = self.osm_edges[self.osm_edges["geometry"].notnull()]
-        self.osm_edges.reset_index(drop=True, inplace=True)
+        self._set_edges(ox.graph_to_gdfs(G, nodes=False))
+
+    def _set_edges(self, edges: gpd.GeoDataFrame):
+        self.osm_edges = edges[edges["geometry"].notnull()]
+        self.osm_edges.reset_index(inplace=True)  # Keep u, v, key as columns
+        # Stable segment ID derived from the OSM edge key, independent of row order
+        self.osm_edges["segment_id"] = (
+            self.osm_edges["u"].astype(str) + "-" + self.osm_edges["v"].astype(str) + "-" + self.osm_edges["key"].astype(str)
+        )
         self.osm_edges["osm_id_index"] = self.osm_edges.index
+        # Matches refer to row positions of the previous network, so start over
+        self._location_segments = {}
+        self._osm_edges_proj = None
+
+    # --- Tiled network ---
+    def _tile_of(self, lon: float, lat: float) -> tuple:
+        return math.floor(lon / self.tile_size), math.floor(lat / self.tile_size)
+
+    def _load_tile(self, tile: tuple):
+        ix, iy = tile
+        tile_path = os.path.join(self.tile_cache_dir, f"{ix}_{iy}.graphml")
+        empty_marker = tile_path + ".empty"
+
+        if os.path.exists(tile_path):
+            G = ox.load_graphml(tile_path)
+        elif os.path.exists(empty_marker):
+            return None
+        else:
+            print(f"🌐 Downloading road network tile {ix}_{iy} from OpenStreetMap...")
+            os.makedirs(self.tile_cache_dir, exist_ok=True)
+            bbox = (ix * self.tile_size, iy * self.tile_size, (ix + 1) * self.tile_size, (iy + 1) * self.tile_size)
+            try:
+                # truncate_by_edge keeps edges crossing the tile border, retain_all keeps roads that are only
+                # connected outside the tile (both deduplicated when tiles are merged)
+                G = ox.graph_from_bbox(bbox, network_type='drive', truncate_by_edge=True, retain_all=True)
+            except InsufficientResponseError:
+                # No drivable roads in this tile (osmnx raises on empty responses); remember that
+                open(empty_marker, "w").close()
+                return None
+            ox.save_graphml(G, filepath=tile_path)
+
+        return ox.graph_to_gdfs(G, nodes=False)
+
+    def load_tiles_for_points(self, points: pd.DataFrame, lon_col="lon", lat_col="lat"):
+        """
+        Ensures the tiles containing the given points, plus their neighbours, are loaded.
+        """
+        needed = set()
+        for lon, lat in points[[lon_col, lat_col]].drop_duplicates().itertuples(index=False):
+            ix, iy = self._tile_of(lon, lat)
+            for dx in range(-self.tile_neighbours, self.tile_neighbours + 1):
+                for dy in range(-self.tile_neighbours, self.tile_neighbours + 1):
+                    needed.add((ix + dx, iy + dy))
+
+        new_tiles = sorted(needed - set(self._tile_edges))
+        if not new_tiles:
+            return
+        print(f"📂 Loading {len(new_tiles)} road network tile(s) ({len(self._tile_edges) + len(new_tiles)} in memory)...")
+        for tile in new_tiles:
+            self._tile_edges[tile] = self._load_tile(tile)
+
+        tile_edges = [edges for edges in self._tile_edges.values() if edges is not None]
+        if not tile_edges:
+            raise ValueError("No road network found around the given detector locations.")
+        merged = pd.concat(tile_edges)
+        # Edges crossing tile borders appear in both tiles
+        merged = merged[~merged.index.duplicated(keep="first")]
+        self._set_edges(gpd.GeoDataFrame(merged, geometry="geometry", crs=tile_edges[0].crs))
 
     def _to_geo(self, df: pd.DataFrame, lon_col="lon", lat_col="lat") -> gpd.GeoDataFrame:
         gdf = gpd.GeoDataFrame(
@@ -39,33 +129,44 @@ class StreetMatcher:
         )
         return gdf
 
-    def match_detectors_to_segments(self, df_enriched: pd.DataFrame) -> gpd.GeoDataFrame:
-        if self.osm_edges is None:
-            self.load_osm_network()
-
-        gdf_detectors = self._to_geo(df_enriched)
+    def _match_new_locations(self, locations: pd.DataFrame):
+        """
+        Finds the nearest road segment for locations not matched before. Detector (or cross-section)
+        locations do not change between hours, so each one is only matched once.
+        """
+        new_locations = locations[[loc not in self._location_segments for loc in zip(locations["lon"], locations["lat"])]]
+        if new_locations.empty:
+            return
 
-        # Reproject both to EPSG:32633 for proper spatial matching
+        # Reproject both to EPSG:32633 for proper spatial matching (the projected network is kept)
         crs_proj = "EPSG:32633"
-        gdf_detectors_proj = gdf_detectors.to_crs(crs_proj)
-        osm_edges_proj = self.osm_edges.to_crs(crs_proj)
+        if self._osm_edges_proj is None:
+            self._osm_edges_proj = self.osm_edges[["osm_id_index", "geometry"]].to_crs(crs_proj)
+        gdf_locations_proj = self._to_geo(new_locations).to_crs(crs_proj)
 
         # Spatial join using projected CRS
-        self.gdf_matched = gpd.sjoin_nearest(
-            gdf_detectors_proj,
-            osm_edges_proj,
-            how="left",
-            distance_col="dist_to_road"
-        )
-        
+        gdf_nearest = gpd.sjoin_nearest(gdf_locations_proj, self._osm_edges_proj, how="left", distance_col="dist_to_road")
+        gdf_nearest = gdf_nearest[~gdf_nearest.index.duplicated(keep="first")]  # Equidistant segments: keep one
+        for lon, lat, osm_id_index in gdf_nearest[["lon", "lat", "osm_id_index"]].itertuples(index=False):
+            self._location_segments[(lon, lat)] = osm_id_index
+
+    def match_detectors_to_segments(self, df_enriched: pd.DataFrame) -> gpd.GeoDataFrame:
+        if self.tile_size is not None:
+            self.load_tiles_for_points(df_enriched)
+        elif self.osm_edges is None:
+            self.load_osm_network()
+
+        self._match_new_locations(df_enriched[["lon", "lat"]].drop_duplicates())
+        kpi_columns = [col for col in df_enriched.columns if col.startswith(('q_', 'v_'))]
+        df_matched = df_enriched[["STRASSE"] + kpi_columns].copy()
+        df_matched["osm_id_index"] = [self._location_segments[loc] for loc in zip(df_enriched["lon"], df_enriched["lat"])]
+
         # Join with OSM edge geometries (to get LINESTRING)
-        gdf_road_kpi = self.gdf_matched.merge(
-            self.osm_edges,  # contains geometry
-            left_on="index_right",
-            right_on="osm_id_index",
-            how="left",
-            suffixes=('_detector', '_road_segment') # Add suffixes to differentiate geometry columns
-            )
+        gdf_road_kpi = df_matched.merge(
+            self.osm_edges[["osm_id_index", "segment_id", "geometry", "name"]],
+            on="osm_id_index",
+            how="left"
+        ).rename(columns={"name": "name_road_segment"})
         
         def flatten_name_field(value):
             if isinstance(value, list):
@@ -76,18 +177,14 @@ class StreetMatcher:
         gdf_road_kpi["name_road_segment"] = gdf_road_kpi["name_road_segment"].fillna(gdf_road_kpi["STRASSE"])
         gdf_road_kpi["name_road_segment"] = gdf_road_kpi["name_road_segment"].apply(flatten_name_field)
         
-        # Keep only relevant columns and rename geometry
-        gdf_road_kpi = gdf_road_kpi.rename(columns={'geometry_road_segment': 'geometry'})
-        gdf_road_kpi = gdf_road_kpi[["geometry","name_road_segment"] + [col for col in df_enriched.columns if col.startswith(('q_', 'v_'))]].copy()
-        gdf_road_kpi = gdf_road_kpi.to_crs("EPSG:4326")  # Back to WGS84
-
-        # Return in original CRS for compatibility with Folium (WGS84)
-        return gdf_road_kpi
+        # Keep only relevant columns, in WGS84 for the map
+        gdf_road_kpi = gdf_road_kpi[["segment_id","geometry","name_road_segment"] + kpi_columns]
+        return gpd.GeoDataFrame(gdf_road_kpi, geometry="geometry", crs=self.osm_edges.crs).to_crs("EPSG:4326")
 
     def aggregate_kpi_by_osm_segment(self, gdf_matched: gpd.GeoDataFrame, kpi_col: str) -> gpd.GeoDataFrame:
         if kpi_col not in gdf_matched.columns:
             raise ValueError(f"KPI column '{kpi_col}' not found in the matched GeoDataFrame for aggregation.")
-        grouped = gdf_matched.groupby(["geometry","name_road_segment"])[kpi_col].mean().reset_index()
+        grouped = gdf_matched.groupby(["segment_id","geometry","name_road_segment"])[kpi_col].mean().reset_index()
         grouped_gdf = gpd.GeoDataFrame(grouped, geometry="geometry", crs="EPSG:4326")
         grouped_gdf = grouped_gdf.rename(columns={kpi_col: "value"})
         return grouped_gdf
\ No newline at end of file
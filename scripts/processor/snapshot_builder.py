@@ -0,0 +1,97 @@
+import json
+import hashlib
+import pandas as pd
+from processor.geometry_codec import encode_geometry
+
+# Snapshot combinations: "<vehicle_type>_<kpi_type>" -> detector KPI column
+KPI_COMBINATIONS = {
+    "all_number_of_vehicles": "q_kfz_det_hr",
+    "all_avg_speed": "v_kfz_det_hr",
+    "cars_number_of_vehicles": "q_pkw_det_hr",
+    "cars_avg_speed": "v_pkw_det_hr",
+    "trucks_number_of_vehicles": "q_lkw_det_hr",
+    "trucks_avg_speed": "v_lkw_det_hr",
+}
+# Same combinations for measurement cross-section (MQ) rows
+MQ_KPI_COMBINATIONS = {combo_key: column.replace("_det_hr", "_mq_hr") for combo_key, column in KPI_COMBINATIONS.items()}
+
+
+def kpi_combinations(level: str) -> dict:
+    return MQ_KPI_COMBINATIONS if level == "mq" else KPI_COMBINATIONS
+
+
+def add_timestamp_column(df: pd.DataFrame) -> pd.DataFrame:
+    df["timestamp"] = df["tag"].dt.strftime("%Y-%m-%d") + " " + df["hour"].astype(str).str.zfill(2) + ":00"
+    return df
+
+
+def compute_content_hash(features: list) -> str:
+    """
+    Hash of a snapshot's features (canonical JSON), used to skip unchanged rewrites and as the
+    browser-side cache key of the frame.
+    """
+    canonical = json.dumps(features, sort_keys=True, separators=(",", ":"), default=float)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class SnapshotBuilder:
+    """
+    Turns the enriched detector rows of one hour into snapshot documents, one per vehicle type/KPI.
+    Shared by the batch generator and the live ingest so both produce identical documents.
+    """
+
+    def __init__(self, matcher, geometry_precision: int = 5, timeseries_builder=None, district_builder=None,
+                 level: str = "det"):
+        self.matcher = matcher
+        self.kpi_combinations = kpi_combinations(level)
+        self.geometry_precision = geometry_precision
+        self.timeseries_builder = timeseries_builder
+        self.district_builder = district_builder
+
+    def build(self, df_ts: pd.DataFrame, ts_str: str) -> list:
+        documents = []
+        # Matching only depends on detector locations, so do it once for all combinations
+        gdf_matched = self.matcher.match_detectors_to_segments(df_ts)
+
+        for combo_key, kpi_column_name in self.kpi_combinations.items():
+            vehicle_type, kpi_type = combo_key.split('_', 1) # Split only on the first underscore
+
+            # Ensure the KPI column exists in the filtered DataFrame for this timestamp
+            if kpi_column_name not in df_ts.columns:
+                print(f"Warning: KPI column '{kpi_column_name}' not found for {ts_str}, combo '{combo_key}'. Skipping this combination.")
+                continue
+
+            # Aggregate the specific KPI column for this combination
+            try:
+                gdf_road_kpi = self.matcher.aggregate_kpi_by_osm_segment(gdf_matched, kpi_col=kpi_column_name)
+            except ValueError as e:
+                print(f"Error aggregating KPI for {ts_str}, combo '{combo_key}': {e}. Skipping.")
+                continue
+
+            if gdf_road_kpi.empty:
+                print(f"No data to insert for {ts_str}, combo '{combo_key}'. GeoDataFrame was empty after aggregation.")
+                continue
+
+            # District aggregates use the exact segment geometry (before simplification)
+            if self.district_builder is not None:
+                self.district_builder.add(ts_str, vehicle_type, kpi_type, gdf_road_kpi)
+
+            # Simplify geometry for faster rendering
+            gdf_road_kpi["geometry"] = gdf_road_kpi["geometry"].simplify(0.0001, preserve_topology=True)
+
+            if self.timeseries_builder is not None:
+                self.timeseries_builder.add(ts_str, vehicle_type, kpi_type, gdf_road_kpi)
+
+            # Convert to GeoJSON features, with compact geometry
+            features = gdf_road_kpi.__geo_interface__["features"]
+            for feature in features:
+                feature["geometry"] = encode_geometry(feature["geometry"], self.geometry_precision)
+
+            documents.append({
+                "timestamp": ts_str,
+                "vehicle_type": vehicle_type,
+                "kpi_type": kpi_type,
+                "features": features,
+                "content_hash": compute_content_hash(features)
+            })
+        return documents
@@ -0,0 +1,347 @@
+import os
+import glob
+import gzip
+import json
+import shutil
+import datetime
+import pandas as pd
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+
+# Datasets written by FileSnapshotSink (one sub-directory each), in the order the bulk loader applies them.
+# The catalog comes last so hours are only published once their data is loaded.
+FILE_DATASETS = ["snapshots", "timeseries", "district_snapshots", "district_boundaries", "catalog"]
+FILE_FORMATS = {"ndjson": ".ndjson.gz", "parquet": ".parquet"}
+# Documents per bulk write, and per file sink part file: the loader's batches never span files,
+# so each part file is loaded as one full bulk write and part files are loaded in parallel
+BULK_BATCH_SIZE = 1000
+# Input levels (see processor/enricher.py). Their values differ in meaning (per lane vs. per cross-section),
+# so each level is stored in its own collections; det keeps the plain names
+LEVELS = ["det", "mq"]
+
+
+def level_collection_name(collection_name: str, level: str) -> str:
+    if level not in LEVELS:
+        raise ValueError(f"Unknown level '{level}', expected one of {LEVELS}")
+    return collection_name if level == "det" else f"{collection_name}_{level}"
+
+
+def _timeseries_filter(doc: dict) -> dict:
+    return {
+        "segment_id": doc["segment_id"],
+        "vehicle_type": doc["vehicle_type"],
+        "kpi_type": doc["kpi_type"],
+        "month": doc["month"]
+    }
+
+
+class MongoSnapshotSink:
+    """
+    Writes snapshot documents, segment time series and the timestamp catalog to MongoDB.
+    Data of the mq level goes to the same collection names with an _mq suffix (district boundaries are
+    shared); the catalog records its level and the sink refuses to write another level into it.
+    """
+
+    def __init__(self, mongo_uri: str, db_name: str, collection_name: str = "road_kpi_snapshots",
+                 timeseries_collection_name: str = "road_kpi_timeseries",
+                 catalog_collection_name: str = "snapshot_catalog",
+                 district_collection_name: str = "road_kpi_district_snapshots",
+                 district_boundary_collection_name: str = "district_boundaries", batch_size: int = BULK_BATCH_SIZE,
+                 level: str = "det"):
+        self.mongo_uri = mongo_uri
+        self.db_name = db_name
+        self.level = level
+        self.collection_name = level_collection_name(collection_name, level)
+        self.timeseries_collection_name = level_collection_name(timeseries_collection_name, level)
+        self.catalog_collection_name = level_collection_name(catalog_collection_name, level)
+        self.district_collection_name = level_collection_name(district_collection_name, level)
+        self.district_boundary_collection_name = district_boundary_collection_name
+        self.batch_size = batch_size
+        self.client = None
+
+    def connect(self):
+        self.client = MongoClient(self.mongo_uri)
+        db = self.client[self.db_name]
+        self.collection = db[self.collection_name]
+        self.timeseries_collection = db[self.timeseries_collection_name]
+        self.catalog_collection = db[self.catalog_collection_name]
+        self.district_collection = db[self.district_collection_name]
+        self.district_boundary_collection = db[self.district_boundary_collection_name]
+        print(f"Connected to MongoDB: {self.mongo_uri}, Database: {self.db_name}, Collection: {self.collection_name}")
+
+        # Catalogs written before levels existed hold det data
+        catalog = self.catalog_collection.find_one({"_id": "timestamps"}, {"level": 1})
+        if catalog is not None and catalog.get("level", "det") != self.level:
+            raise ValueError(f"{self.catalog_collection_name} holds {catalog.get('level', 'det')} data, "
+                             f"refusing to write {self.level} data into it")
+
+        # Create indexes for efficient querying
+        self.collection.create_index([
+            ("timestamp", 1),
+            ("vehicle_type", 1),
+            ("kpi_type", 1)
+        ])
+        print("Created compound index on timestamp, vehicle_type, kpi_type.")
+
+        # Covers the dashboard's frame manifest query (timestamp -> content_hash) without reading the features
+        self.collection.create_index([
+            ("vehicle_type", 1),
+            ("kpi_type", 1),
+            ("timestamp", 1),
+            ("content_hash", 1)
+        ])
+        print("Created covering index for frame manifests.")
+
+        # One document per segment/KPI/month, looked up by segment on click
+        self.timeseries_collection.create_index([
+            ("segment_id", 1),
+            ("vehicle_type", 1),
+            ("kpi_type", 1),
+            ("month", 1)
+        ], unique=True)
+        print("Created unique index on segment_id, vehicle_type, kpi_type, month.")
+
+        # Range statistics match all segments of one KPI and a few months
+        self.timeseries_collection.create_index([
+            ("vehicle_type", 1),
+            ("kpi_type", 1),
+            ("month", 1)
+        ])
+        print("Created index on vehicle_type, kpi_type, month for range statistics.")
+
+        # One small document per hour/KPI with the values of all districts
+        self.district_collection.create_index([
+            ("vehicle_type", 1),
+            ("kpi_type", 1),
+            ("timestamp", 1)
+        ], unique=True)
+        print("Created unique index on vehicle_type, kpi_type, timestamp for district snapshots.")
+
+    def write_snapshot(self, snapshot_document: dict) -> str:
+        """
+        Upserts one snapshot; returns "inserted", "updated" or "unchanged" (same content hash).
+        """
+        snapshot_filter = {
+            "timestamp": snapshot_document["timestamp"],
+            "vehicle_type": snapshot_document["vehicle_type"],
+            "kpi_type": snapshot_document["kpi_type"]
+        }
+        existing = self.collection.find_one(snapshot_filter, {"_id": 0, "content_hash": 1})
+        if existing and existing.get("content_hash") == snapshot_document["content_hash"]:
+            return "unchanged"
+        self.collection.replace_one(snapshot_filter, snapshot_document, upsert=True)
+        return "updated" if existing else "inserted"
+
+    def write_snapshots(self, snapshot_documents: list) -> int:
+        """
+        Bulk version of write_snapshot: existing content hashes are read with one query per batch,
+        unchanged snapshots are skipped. Returns the number of snapshots written.
+        """
+        existing_hashes = {}
+        timestamps = sorted({doc["timestamp"] for doc in snapshot_documents})
+        for doc in self.collection.find({"timestamp": {"$in": timestamps}},
+                                        {"_id": 0, "timestamp": 1, "vehicle_type": 1, "kpi_type": 1, "content_hash": 1}):
+            existing_hashes[(doc["timestamp"], doc["vehicle_type"], doc["kpi_type"])] = doc.get("content_hash")
+
+        requests = [
+            ReplaceOne({"timestamp": doc["timestamp"], "vehicle_type": doc["vehicle_type"], "kpi_type": doc["kpi_type"]},
+                       doc, upsert=True)
+            for doc in snapshot_documents
+            if existing_hashes.get((doc["timestamp"], doc["vehicle_type"], doc["kpi_type"])) != doc["content_hash"]
+        ]
+        self._bulk_write(self.collection, requests)
+        return len(requests)
+
+    def write_timeseries(self, timeseries_documents: list):
+        """
+        Replaces whole segment time series documents (batch generation covers every hour of the month).
+        """
+        requests = [ReplaceOne(_timeseries_filter(doc), doc, upsert=True) for doc in timeseries_documents]
+        self._bulk_write(self.timeseries_collection, requests)
+
+    def update_timeseries(self, timeseries_documents: list):
+        """
+        Merges newly ingested hours into existing time series documents: creates missing documents
+        with an empty array, then sets only the slots that carry a value.
+        """
+        skeletons = []
+        slot_updates = []
+        for doc in timeseries_documents:
+            skeleton = {key: value for key, value in doc.items() if key != "values"}
+            skeleton["values"] = [None] * len(doc["values"])
+            skeletons.append(UpdateOne(_timeseries_filter(doc), {"$setOnInsert": skeleton}, upsert=True))
+
+            new_values = {f"values.{slot}": value for slot, value in enumerate(doc["values"]) if value is not None}
+            if new_values:
+                slot_updates.append(UpdateOne(_timeseries_filter(doc), {"$set": new_values}))
+
+        self._bulk_write(self.timeseries_collection, skeletons)
+        self._bulk_write(self.timeseries_collection, slot_updates)
+
+    def write_district_snapshots(self, district_documents: list):
+        """
+        Upserts per-district hourly aggregates (whole hours, so replacing is safe for live ingest too).
+        """
+        requests = [
+            ReplaceOne({"timestamp": doc["timestamp"], "vehicle_type": doc["vehicle_type"], "kpi_type": doc["kpi_type"]},
+                       doc, upsert=True)
+            for doc in district_documents
+        ]
+        self._bulk_write(self.district_collection, requests)
+
+    def write_district_boundaries(self, boundary_documents: list):
+        requests = [ReplaceOne({"district": doc["district"]}, doc, upsert=True) for doc in boundary_documents]
+        self._bulk_write(self.district_boundary_collection, requests)
+
+    def update_catalog(self, timestamps):
+        """
+        Adds timestamps to the catalog the dashboard reads its available time range from.
+        A database filled before the catalog existed is seeded with its snapshot timestamps first,
+        since the dashboard only reads the catalog once there is one.
+        """
+        timestamps = set(timestamps)
+        if self.catalog_collection.find_one({"_id": "timestamps"}, {"_id": 1}) is None:
+            timestamps.update(self.collection.distinct("timestamp"))
+        timestamps = sorted(timestamps)
+        if not timestamps:
+            return
+        self.catalog_collection.update_one(
+            {"_id": "timestamps"},
+            {
+                "$addToSet": {"timestamps": {"$each": timestamps}},
+                "$max": {"latest_timestamp": timestamps[-1]}, # Cheap "anything new?" check for the dashboard
+                "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc), "level": self.level}
+            },
+            upsert=True
+        )
+
+    def _bulk_write(self, collection, requests: list):
+        for start in range(0, len(requests), self.batch_size):
+            collection.bulk_write(requests[start:start + self.batch_size], ordered=False)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+class FileSnapshotSink:
+    """
+    Writes the same documents as MongoSnapshotSink to local files instead, so generation can run
+    without a database; load_snapshots.py then imports them in parallel bulk batches.
+
+    Each dataset gets its own sub-directory of numbered part files with up to docs_per_file documents:
+    gzip-compressed newline-delimited JSON, or Parquet (zstd) with one JSON-encoded document per row,
+    since the nested, mixed-type features do not map onto a fixed Parquet schema.
+    """
+
+    def __init__(self, output_dir: str, file_format: str = "ndjson", docs_per_file: int = BULK_BATCH_SIZE,
+                 overwrite: bool = False, level: str = "det"):
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"Unknown file format '{file_format}', expected one of {list(FILE_FORMATS)}")
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level '{level}', expected one of {LEVELS}")
+        self.level = level
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.docs_per_file = docs_per_file
+        self.overwrite = overwrite
+        self._parts = {}  # dataset -> [part index, documents in the current part, open file or buffered rows]
+        self._timestamps = set()
+
+    def connect(self):
+        for dataset in FILE_DATASETS:
+            dataset_dir = os.path.join(self.output_dir, dataset)
+            if os.path.exists(dataset_dir) and os.listdir(dataset_dir):
+                if not self.overwrite:
+                    raise FileExistsError(f"{dataset_dir} already contains files (use overwrite to replace them)")
+                shutil.rmtree(dataset_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        print(f"Writing {self.file_format} files to: {self.output_dir}")
+
+    def write_snapshot(self, snapshot_document: dict) -> str:
+        self._write("snapshots", [snapshot_document])
+        return "written"
+
+    def write_timeseries(self, timeseries_documents: list):
+        self._write("timeseries", timeseries_documents)
+
+    def write_district_snapshots(self, district_documents: list):
+        self._write("district_snapshots", district_documents)
+
+    def write_district_boundaries(self, boundary_documents: list):
+        self._write("district_boundaries", boundary_documents)
+
+    def update_catalog(self, timestamps):
+        # Written once on close, as a single document (with the level, so the loader picks the right collections)
+        self._timestamps.update(timestamps)
+
+    def close(self):
+        if self._timestamps:
+            self._write("catalog", [{"timestamps": sorted(self._timestamps), "level": self.level}])
+        for dataset in list(self._parts):
+            self._finish_part(dataset)
+
+    def _write(self, dataset: str, documents: list):
+        for doc in documents:
+            part = self._parts.get(dataset)
+            if part is None or part[1] >= self.docs_per_file:
+                part = self._start_part(dataset, part[0] + 1 if part else 0)
+            line = json.dumps(doc, separators=(",", ":"), default=float)
+            if self.file_format == "ndjson":
+                part[2].write(line + "\n")
+            else:
+                part[2].append(line)
+            part[1] += 1
+
+    def _part_path(self, dataset: str, index: int) -> str:
+        return os.path.join(self.output_dir, dataset, f"part-{index:05d}{FILE_FORMATS[self.file_format]}")
+
+    def _start_part(self, dataset: str, index: int) -> list:
+        self._finish_part(dataset)
+        os.makedirs(os.path.join(self.output_dir, dataset), exist_ok=True)
+        if self.file_format == "ndjson":
+            output = gzip.open(self._part_path(dataset, index), "wt", encoding="utf-8")
+        else:
+            output = []  # Parquet parts are written in one go when full
+        self._parts[dataset] = [index, 0, output]
+        return self._parts[dataset]
+
+    def _finish_part(self, dataset: str):
+        part = self._parts.pop(dataset, None)
+        if part is None:
+            return
+        index, _, output = part
+        if self.file_format == "ndjson":
+            output.close()
+        else:
+            pd.DataFrame({"document": output}).to_parquet(self._part_path(dataset, index), compression="zstd", index=False)
+
+
+def list_part_files(input_dir: str, dataset: str) -> list:
+    return sorted(
+        path for suffix in FILE_FORMATS.values()
+        for path in glob.glob(os.path.join(input_dir, dataset, f"part-*{suffix}"))
+    )
+
+
+def read_part_file(path: str):
+    """
+    Yields the documents of one part file written by FileSnapshotSink.
+    """
+    if path.endswith(FILE_FORMATS["parquet"]):
+        for line in pd.read_parquet(path, columns=["document"])["document"]:
+            yield json.loads(line)
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_level(input_dir: str) -> str:
+    """
+    Level recorded in a file sink's catalog (det for files without one).
+    """
+    for path in list_part_files(input_dir, "catalog"):
+        for doc in read_part_file(path):
+            return doc.get("level", "det")
+    return "det"
@@ -0,0 +1,57 @@
+import calendar
+import pandas as pd
+from shapely.geometry import mapping
+from processor.geometry_codec import encode_geometry
+
+
+def month_key(ts: pd.Timestamp) -> str:
+    return ts.strftime("%Y-%m")
+
+
+def hours_in_month(ts: pd.Timestamp) -> int:
+    return calendar.monthrange(ts.year, ts.month)[1] * 24
+
+
+def hour_offset(ts: pd.Timestamp) -> int:
+    # Slot of an hourly timestamp inside its month's packed array (day-major, 24 slots per day)
+    return (ts.day - 1) * 24 + ts.hour
+
+
+class SegmentTimeSeriesBuilder:
+    """
+    Collects hourly per-segment KPI values into a segment-major layout:
+    one record per (segment, vehicle type, KPI, month) holding a packed hourly value array.
+    The segment geometry is kept on the record so range statistics can be computed and
+    returned as a map frame by the database alone.
+    """
+
+    def __init__(self, geometry_precision: int = None):
+        self.geometry_precision = geometry_precision
+        self._series = {}
+
+    def add(self, ts_str: str, vehicle_type: str, kpi_type: str, gdf_road_kpi: pd.DataFrame):
+        ts = pd.Timestamp(ts_str)
+        month = month_key(ts)
+        slot = hour_offset(ts)
+
+        for row in gdf_road_kpi[["segment_id", "name_road_segment", "geometry", "value"]].itertuples(index=False):
+            key = (row.segment_id, vehicle_type, kpi_type, month)
+            record = self._series.get(key)
+            if record is None:
+                record = {
+                    "segment_id": row.segment_id,
+                    "vehicle_type": vehicle_type,
+                    "kpi_type": kpi_type,
+                    "month": month,
+                    "name_road_segment": row.name_road_segment,
+                    "geometry": encode_geometry(mapping(row.geometry), self.geometry_precision),
+                    "values": [None] * hours_in_month(ts),  # None marks hours without a measurement
+                }
+                self._series[key] = record
+            record["values"][slot] = float(row.value) if pd.notnull(row.value) else None
+
+    def documents(self) -> list:
+        return list(self._series.values())
+
+    def __len__(self):
+        return len(self._series)
@@ -0,0 +1,114 @@
+import os
+import json
+import glob
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+MATRIX_META_FILE = "matrix_meta.json"
+SEGMENT_INDEX_FILE = "segment_index.parquet"
+GENERATION_DIR_PREFIX = "generation-"
+
+
+def matrix_file_name(vehicle_type: str, kpi_type: str) -> str:
+    return f"{vehicle_type}_{kpi_type}.npy"
+
+
+def hashes_file_name(vehicle_type: str, kpi_type: str) -> str:
+    return f"{vehicle_type}_{kpi_type}_hashes.json"
+
+
+def _save_atomic(path: str, write, mode: str = "wb"):
+    # Write next to the target and swap it in, so readers never see a partially written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _current_generation_dir(output_dir: str):
+    try:
+        with open(os.path.join(output_dir, MATRIX_META_FILE)) as f:
+            return json.load(f).get("directory")
+    except FileNotFoundError:
+        return None
+
+
+def write_value_matrices(timeseries_documents: list, output_dir: str, content_hashes: dict = None):
+    """
+    Writes the segment time series as one dense segments x hours matrix per vehicle type/KPI
+    (.npy, NaN = no value), plus a segment index shared by all matrices and the hour axis metadata.
+
+    Each run writes a new generation sub-directory; only then is matrix_meta.json, which names it,
+    replaced. Readers therefore always open the files of one complete generation, and processes that
+    still map the previous generation keep it (the one before is removed).
+
+    The matrices are stored column-major, so the hours of any time range are one contiguous block
+    that the app can memory-map and slice without copying. Values are float64, the exact values of
+    the snapshot documents; content_hashes ({(vehicle_type, kpi_type, timestamp): content_hash}) records
+    which snapshot each hour column was built from, so the app only uses columns still matching MongoDB.
+    """
+    content_hashes = content_hashes or {}
+    if not timeseries_documents:
+        return
+    generation = uuid.uuid4().hex
+    generation_dir = os.path.join(output_dir, GENERATION_DIR_PREFIX + generation)
+    os.makedirs(generation_dir)
+
+    months = sorted({doc["month"] for doc in timeseries_documents})
+    start = pd.Timestamp(f"{months[0]}-01")
+    end = pd.Timestamp(f"{months[-1]}-01") + pd.offsets.MonthBegin(1)
+    hours = int((end - start) / pd.Timedelta(hours=1))
+
+    # Rows are shared by all combinations: the union of segments, in segment_id order
+    segments = {}
+    for doc in timeseries_documents:
+        segments.setdefault(doc["segment_id"], (doc["name_road_segment"], doc["geometry"]))
+    segment_ids = sorted(segments)
+    row_of = {segment_id: row for row, segment_id in enumerate(segment_ids)}
+
+    combos = sorted({(doc["vehicle_type"], doc["kpi_type"]) for doc in timeseries_documents})
+    for vehicle_type, kpi_type in combos:
+        matrix = np.full((len(segment_ids), hours), np.nan, dtype=np.float64, order="F")
+        for doc in timeseries_documents:
+            if doc["vehicle_type"] != vehicle_type or doc["kpi_type"] != kpi_type:
+                continue
+            offset = int((pd.Timestamp(f"{doc['month']}-01") - start) / pd.Timedelta(hours=1))
+            matrix[row_of[doc["segment_id"]], offset:offset + len(doc["values"])] = np.array(doc["values"], dtype=np.float64)
+        with open(os.path.join(generation_dir, matrix_file_name(vehicle_type, kpi_type)), "wb") as f:
+            np.save(f, matrix)
+
+        # Content hash of the snapshot behind each hour column (None = no snapshot)
+        hour_hashes = [
+            content_hashes.get((vehicle_type, kpi_type, ts.strftime("%Y-%m-%d %H:00")))
+            for ts in pd.date_range(start, periods=hours, freq="h")
+        ]
+        with open(os.path.join(generation_dir, hashes_file_name(vehicle_type, kpi_type)), "w") as f:
+            json.dump(hour_hashes, f)
+
+    df_index = pd.DataFrame({
+        "segment_id": segment_ids,
+        "name_road_segment": [segments[segment_id][0] for segment_id in segment_ids],
+        "geometry": [json.dumps(segments[segment_id][1]) for segment_id in segment_ids],  # As stored in the snapshots
+    })
+    df_index.to_parquet(os.path.join(generation_dir, SEGMENT_INDEX_FILE), index=False)
+
+    meta = {
+        "start": start.strftime("%Y-%m-%d %H:00"),
+        "hours": hours,
+        "segments": len(segment_ids),
+        "dtype": "float64",
+        "generation": generation,
+        "directory": os.path.basename(generation_dir),
+        "combos": [f"{vehicle_type}_{kpi_type}" for vehicle_type, kpi_type in combos],
+    }
+    previous_dir = _current_generation_dir(output_dir)
+    # Metadata last: readers only switch to the new generation once all of its files are in place
+    _save_atomic(os.path.join(output_dir, MATRIX_META_FILE), lambda f: json.dump(meta, f, indent=2), mode="w")
+
+    # Keep the previous generation for readers that opened it just before the swap, drop older ones
+    for old_dir in glob.glob(os.path.join(output_dir, GENERATION_DIR_PREFIX + "*")):
+        if os.path.basename(old_dir) not in (meta["directory"], previous_dir):
+            shutil.rmtree(old_dir, ignore_errors=True)  # Still mapped files cannot be removed on Windows
+    print(f"Wrote {len(combos)} value matrices ({len(segment_ids)} segments x {hours} hours) to {output_dir}")
@@ -1,20 +1,37 @@
 # streamlit_app/Home.py
 
 import os
-import json
 
 import streamlit as st
 import pandas as pd
 import geopandas as gpd
 import streamlit.components.v1 as components
 import time
-from pymongo import MongoClient # Import MongoClient
 import datetime
+import bisect
+from data_access import (
+    get_mongo_client, load_available_times, load_frame_manifest, load_snapshots_from_mongodb,
+    load_segment_timeseries, load_segment_statistics, load_district_boundaries, load_district_values,
+    load_value_matrix, value_matrix_generation, VALUE_MATRIX_DIR
+)
+from map_html import create_map_html
 
 # --- MongoDB Configuration ---
+# Data generated with --level mq lives in the same collections with an _mq suffix (and value_matrix_mq/);
+# point these variables and VALUE_MATRIX_DIR there to serve the cross-section level
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("MONGO_DB_NAME", "traffic_dashboard")
 COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME", "road_kpi_snapshots")
+TIMESERIES_COLLECTION_NAME = os.getenv("MONGO_TIMESERIES_COLLECTION_NAME") or "road_kpi_timeseries"
+CATALOG_COLLECTION_NAME = os.getenv("MONGO_CATALOG_COLLECTION_NAME") or "snapshot_catalog"
+DISTRICT_COLLECTION_NAME = os.getenv("MONGO_DISTRICT_COLLECTION_NAME") or "road_kpi_district_snapshots"
+DISTRICT_BOUNDARY_COLLECTION_NAME = os.getenv("MONGO_DISTRICT_BOUNDARY_COLLECTION_NAME") or "district_boundaries"
+
+# Bidirectional map component: hosts the generated map HTML and reports segment clicks back to Python
+traffic_map_component = components.declare_component(
+    "traffic_map",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "traffic_map")
+)
 
 # UI setup
 st.set_page_config(page_title="Berlin Traffic Map", layout="wide")
@@ -23,67 +40,18 @@ st.title("🛣️ Berlin Traffic Detector Map")
     
 with st.spinner("🔄 Loading available timeframes from MongoDB..."):
     try:
-        client = MongoClient(MONGO_URI)
-        collection = client[DB_NAME][COLLECTION_NAME]
-
-        # Fetch all distinct timestamps
-        all_timestamps = collection.distinct("timestamp")
+        # Read on every run, so newly ingested hours show up right away
+        all_timestamps = load_available_times(MONGO_URI, DB_NAME, COLLECTION_NAME, CATALOG_COLLECTION_NAME)
         df_timestamps = pd.to_datetime(all_timestamps)
 
         # Generate derived time lists
         unique_times = sorted(pd.Series(df_timestamps).dt.strftime("%Y-%m-%d %H:00").unique())
         unique_dates = sorted(pd.Series(df_timestamps).dt.date.unique())
         unique_hours = sorted(pd.Series(df_timestamps).dt.hour.unique())
-
-        client.close()
     except Exception as e:
         st.error(f"❌ Failed to load time data from MongoDB: {e}")
         st.stop()
 
-# --- MongoDB Data Loading Function ---
-def load_snapshots_from_mongodb(mongo_uri: str, db_name: str, collection_name: str,
-                                 selected_vehicle_type: str, selected_kpi_type: str,
-                                 time_range_times: list) -> dict:
-    """
-    Loads specific GeoJSON snapshots from MongoDB based on selected filters and time range.
-    """
-    all_geojson_data = {}
-    try:
-        client = MongoClient(mongo_uri)
-        db = client[db_name]
-        collection = db[collection_name]
-
-        # Query MongoDB for documents matching the criteria
-        # Use $in for the list of timestamps to fetch all required frames for the animation
-        query = {
-            "timestamp": {"$in": time_range_times},
-            "vehicle_type": selected_vehicle_type,
-            "kpi_type": selected_kpi_type
-        }
-        # Fetch documents, excluding the _id field, and sort by timestamp to ensure animation order
-        cursor = collection.find(query, {"_id": 0}).sort("timestamp", 1)
-
-        fetched_documents = list(cursor)
-
-        if not fetched_documents:
-            st.warning(f"No data found for the selected combination: Vehicle Type='{selected_vehicle_type}', KPI='{selected_kpi_type}' within the time range.")
-            return {}
-
-        for doc in fetched_documents:
-            ts = doc["timestamp"]
-            # MongoDB BSON documents are directly usable as Python dictionaries.
-            # Convert to FeatureCollection format for Leaflet's L.geoJSON
-            feature_collection = {"type": "FeatureCollection", "features": doc["features"]}
-            all_geojson_data[ts] = feature_collection
-
-        client.close() # Close connection after fetching
-        # Sort the dictionary by timestamp keys to ensure correct animation order
-        return {k: all_geojson_data[k] for k in sorted(all_geojson_data)}
-
-    except Exception as e:
-        st.error(f"Error loading snapshots from MongoDB: {e}")
-        return {} # Return empty dict on error
-
 # --- Streamlit Session State Initialization ---
 if "animation_start_index" not in st.session_state:
     st.session_state["animation_start_index"] = 0
@@ -100,6 +68,21 @@ if "selected_vehicle_type" not in st.session_state:
     st.session_state["selected_vehicle_type"] = "all" # Default to 'all'
 if "selected_kpi_type" not in st.session_state:
     st.session_state["selected_kpi_type"] = "number_of_vehicles" # Default to 'number_of_vehicles
+if "view_mode" not in st.session_state:
+    st.session_state["view_mode"] = "Animation"
+# Content hashes of the frames the browser has cached (None = not reported yet in this session)
+if "client_frame_hashes" not in st.session_state:
+    st.session_state["client_frame_hashes"] = None
+if "frame_cache_disabled" not in st.session_state:
+    st.session_state["frame_cache_disabled"] = False
+if "last_map_event_at" not in st.session_state:
+    st.session_state["last_map_event_at"] = None
+# "segments" or "districts", as last reported by the map (depends on its zoom level)
+if "map_level" not in st.session_state:
+    st.session_state["map_level"] = "segments"
+# Road segment clicked on the map (shown in the history chart)
+if "selected_segment" not in st.session_state:
+    st.session_state["selected_segment"] = None
 
 
 # --- Sidebar Controls ---
@@ -117,6 +100,21 @@ KPI_TYPE_OPTIONS = {
     "Average Speed (km/h)": "avg_speed"
 }
 
+STATISTIC_OPTIONS = {
+    "Mean": "mean",
+    "Percentile": "percentile",
+    "Period Comparison (A - B)": "comparison"
+}
+
+# Animation of hourly frames, or one frame of per-segment statistics computed by the database
+st.session_state["view_mode"] = st.sidebar.radio(
+    "View Mode",
+    options=["Animation", "Statistics"],
+    index=["Animation", "Statistics"].index(st.session_state["view_mode"]),
+    horizontal=True,
+    key="view_mode_selector"
+)
+
 # Add new select boxes for Vehicle Type and KPI Type
 selected_vehicle_type_display = st.sidebar.selectbox(
     "Select Vehicle Type",
@@ -174,7 +172,11 @@ end_datetime_obj = datetime.datetime.combine(selected_end_date, datetime.datetim
 start_time_str = start_datetime_obj.strftime("%Y-%m-%d %H:00")
 end_time_str = end_datetime_obj.strftime("%Y-%m-%d %H:00")
 
-st.session_state["animation_end_index"] = unique_times.index(end_time_str)
+# The newest day can be partial while the live ingest is publishing it (e.g. "23:00" does not exist yet):
+# clamp the end to the latest available hour at or before the selection
+end_index = max(bisect.bisect_right(unique_times, end_time_str) - 1, 0)
+end_time_str = unique_times[end_index]
+st.session_state["animation_end_index"] = end_index
 
 # Ensure start is not after end
 if st.session_state["animation_start_index"] > st.session_state["animation_end_index"]:
@@ -203,18 +205,153 @@ st.session_state["animation_speed"] = animation_speed_ms
 # Filter unique_times list based on selected start and end index for MongoDB query
 times_for_query = unique_times[st.session_state["animation_start_index"] : st.session_state["animation_end_index"] + 1]
 
-with st.spinner("Loading map data from database..."): # Explicit spinner for database fetch
-    # Load data from MongoDB based on current selections
-    # Crucial for re-fetching data only when selections change
-    all_geojson_data = load_snapshots_from_mongodb(
-        MONGO_URI, DB_NAME, COLLECTION_NAME,
-        st.session_state["selected_vehicle_type"], # Use internal keys
-        st.session_state["selected_kpi_type"],     # Use internal keys
-        times_for_query
+selected_statistic = None
+if st.session_state["view_mode"] == "Statistics":
+    st.sidebar.markdown("---")
+    st.sidebar.header("Statistics")
+    selected_statistic = STATISTIC_OPTIONS[st.sidebar.selectbox(
+        "Statistic", options=list(STATISTIC_OPTIONS.keys()), key="statistic_selector"
+    )]
+    selected_percentile = 50
+    if selected_statistic == "percentile":
+        selected_percentile = st.sidebar.slider("Percentile", min_value=1, max_value=99, value=85, key="percentile_slider")
+
+    # Period A is the selected start/end range, optionally restricted to some hours of the day
+    period_a_hours = st.sidebar.multiselect(
+        "Hours of Day (Period A)", options=unique_hours, default=unique_hours, key="period_a_hours_selector"
     )
+    period_a = [ts for ts in pd.date_range(start_datetime_obj, end_datetime_obj, freq="h") if ts.hour in period_a_hours]
+
+    period_b = None
+    if selected_statistic == "comparison":
+        # e.g. same dates with off-peak hours for a peak vs off-peak comparison
+        period_b_start_date = st.sidebar.date_input("Period B Start Date", value=selected_start_date, min_value=min(unique_dates), max_value=max(unique_dates), key="period_b_start_date_picker")
+        period_b_end_date = st.sidebar.date_input("Period B End Date", value=selected_end_date, min_value=min(unique_dates), max_value=max(unique_dates), key="period_b_end_date_picker")
+        period_b_hours = st.sidebar.multiselect(
+            "Hours of Day (Period B)", options=unique_hours, default=unique_hours, key="period_b_hours_selector"
+        )
+        period_b = [
+            ts for ts in pd.date_range(period_b_start_date, datetime.datetime.combine(period_b_end_date, datetime.time(23)), freq="h")
+            if ts.hour in period_b_hours
+        ]
+
+    statistic_label = [k for k, v in STATISTIC_OPTIONS.items() if v == selected_statistic][0]
+    if selected_statistic == "percentile":
+        statistic_label = f"P{selected_percentile}"
+    statistic_frame_key = f"{statistic_label} | {start_time_str} - {end_time_str}"
+
+    with st.spinner("Computing statistics in the database..."):
+        try:
+            statistic_frame = load_segment_statistics(
+                MONGO_URI, DB_NAME, TIMESERIES_COLLECTION_NAME,
+                st.session_state["selected_vehicle_type"],
+                st.session_state["selected_kpi_type"],
+                selected_statistic, period_a, period_b, selected_percentile
+            )
+        except Exception as e:
+            st.error(f"Error computing statistics in MongoDB: {e}")
+            statistic_frame = {}
+    # A single result frame, rendered through the same map as the animation
+    all_geojson_data = {statistic_frame_key: statistic_frame} if statistic_frame.get("features") else {}
+    frame_manifest = {statistic_frame_key: None} if all_geojson_data else {} # Not cached in the browser
+    district_boundaries, district_values = None, None # Statistics are shown per segment only
+else:
+    try:
+        frame_manifest = load_frame_manifest(
+            MONGO_URI, DB_NAME, COLLECTION_NAME,
+            st.session_state["selected_vehicle_type"],
+            st.session_state["selected_kpi_type"],
+            times_for_query
+        )
+    except Exception as e:
+        st.error(f"Error loading frame list from MongoDB: {e}")
+        frame_manifest = {}
+
+    # Only fetch frames the browser does not have cached under the same content hash.
+    # Until the browser has reported its cache in this session, assume it has everything:
+    # it reports what is missing and the next run sends exactly those frames.
+    client_frame_hashes = st.session_state["client_frame_hashes"]
+    if st.session_state["frame_cache_disabled"]:
+        times_to_fetch = list(frame_manifest)
+    elif client_frame_hashes is None:
+        times_to_fetch = [ts for ts, content_hash in frame_manifest.items() if content_hash is None]
+    else:
+        times_to_fetch = [ts for ts, content_hash in frame_manifest.items()
+                          if content_hash is None or content_hash not in client_frame_hashes]
+
+    # District aggregates for the whole range are tiny; while the map is zoomed out they are all it shows,
+    # so segment frames are only fetched once it is zoomed in
+    try:
+        district_boundaries = load_district_boundaries(MONGO_URI, DB_NAME, DISTRICT_BOUNDARY_COLLECTION_NAME)
+        district_values = load_district_values(
+            MONGO_URI, DB_NAME, DISTRICT_COLLECTION_NAME,
+            st.session_state["selected_vehicle_type"],
+            st.session_state["selected_kpi_type"],
+            times_for_query
+        ) if district_boundaries["features"] else None
+    except Exception as e:
+        st.warning(f"District aggregates unavailable, showing road segments only: {e}")
+        district_boundaries, district_values = None, None
+    if district_values and st.session_state["map_level"] == "districts":
+        times_to_fetch = []
+    elif not district_values:
+        district_boundaries = None
+
+    # Progressive rendering: show the first chunk as a preview map while the rest of the range streams in
+    preview_placeholder = st.empty()
+    loading_progress = st.progress(0.0, text="Loading map data from database...")
+
+    def show_loading_progress(frames_so_far: dict, chunks_done: int, chunk_count: int):
+        loading_progress.progress(chunks_done / chunk_count, text=f"Loaded {chunks_done} of {chunk_count} days...")
+        if chunks_done == 1 and chunk_count > 1 and frames_so_far:
+            preview_times = sorted(frames_so_far)
+            with preview_placeholder.container():
+                # Not interactive; frames are still written to the browser cache by the preview map
+                st.markdown("### 📍 Animated Traffic Map")
+                st.caption(f"Showing {preview_times[0][:10]} while the remaining {chunk_count - 1} days load...")
+                components.html(create_map_html(
+                    geojson_data_all_times=frames_so_far,
+                    available_times_list=preview_times,
+                    start_idx=0,
+                    end_idx=len(preview_times) - 1,
+                    speed_ms=st.session_state["animation_speed"],
+                    initial_current_idx=0,
+                    auto_play_on_load=st.session_state["auto_playing"],
+                    selected_v_type_label=selected_vehicle_type_display,
+                    selected_kpi_type_label=selected_kpi_type_display,
+                    frame_hashes={ts: frame_manifest[ts] for ts in preview_times}
+                ), height=700, scrolling=False)
+
+    # Frames covered by the generator's value matrix are sliced from the shared memory-mapped file;
+    # hours outside it or changed since (e.g. by the live ingest) still come from MongoDB
+    all_geojson_data = {}
+    value_matrix = load_value_matrix(VALUE_MATRIX_DIR, st.session_state["selected_vehicle_type"],
+                                     st.session_state["selected_kpi_type"],
+                                     value_matrix_generation(VALUE_MATRIX_DIR)) if times_to_fetch else None
+    if value_matrix is not None:
+        all_geojson_data = value_matrix.frames({ts: frame_manifest[ts] for ts in times_to_fetch})
+        times_to_fetch = [ts for ts in times_to_fetch if ts not in all_geojson_data]
 
-# Extract available times for animation from the loaded data    
-available_times_for_animation = sorted(list(all_geojson_data.keys()))
+    # Load data from MongoDB based on current selections
+    # Crucial for re-fetching data only when selections change
+    if times_to_fetch:
+        all_geojson_data.update(load_snapshots_from_mongodb(
+            MONGO_URI, DB_NAME, COLLECTION_NAME,
+            st.session_state["selected_vehicle_type"], # Use internal keys
+            st.session_state["selected_kpi_type"],     # Use internal keys
+            times_to_fetch,
+            on_chunk_loaded=show_loading_progress
+        ))
+    # The interactive map below replaces the preview once everything is loaded
+    loading_progress.empty()
+    preview_placeholder.empty()
+
+    # Frames sent in this run will be in the browser cache from now on
+    if client_frame_hashes is not None:
+        client_frame_hashes.update(frame_manifest[ts] for ts in all_geojson_data if frame_manifest.get(ts))
+
+# Extract available times for animation from the frame list (frames not sent come from the browser cache)
+available_times_for_animation = list(frame_manifest.keys())
 
 
 if not available_times_for_animation:
@@ -244,387 +381,6 @@ if st.session_state["current_animation_index"] < 0 or \
     st.session_state["current_animation_index"] = 0 # Reset to start of available data
 
 
-# --- Map HTML Generation ---
-def create_map_html(
-    geojson_data_all_times: dict, # Now contains data for specific vehicle/kpi combo
-    available_times_list: list, # List of times for the current combo
-    start_idx: int,
-    end_idx: int,
-    speed_ms: int, # Speed in milliseconds
-    initial_current_idx: int,
-    auto_play_on_load: bool,
-    initial_zoom: int = 12,
-    initial_center: list = [52.52, 13.405],
-    selected_v_type_label: str = "All Vehicles",
-    selected_kpi_type_label: str = "Number of Vehicles"
-) -> str:
-    # Convert Python dicts/lists to JSON strings for embedding in JavaScript
-    geojson_json_str = json.dumps(geojson_data_all_times)
-    times_json_str = json.dumps(available_times_list)
-
-    # # Determine KPI for color scale, assuming 'value' field in GeoJSON properties
-    # kpi_field = "value"
-
-    # Dynamic legend based on selected KPI (passed from Python)
-    legend_title = f"{selected_v_type_label} - {selected_kpi_type_label}"
-    
-    # Define color scale based on the type of KPI (passed from Python)
-    
-    if "speed" in selected_kpi_type_label.lower(): # Check if it's a speed KPI
-        color_scale_js = """
-        function getColor(d) {
-            return d > 70 ? '#1A9850' : // Dark Green (70+ km/h)
-                   d > 60 ? '#66BD63' : // Green (61-70 km/h)
-                   d > 50 ? '#A6D96A' : // Light Green (51-60 km/h)
-                   d > 40 ? '#D9EF8B' : // Yellow-Green (41-50 km/h)
-                   d > 30 ? '#FEE08B' : // Light Orange (31-40 km/h)
-                   d > 20 ? '#FDAE61' : // Orange (21-30 km/h)
-                   d > 0  ? '#F46D43' : // Orange-Red (1-20 km/h)
-                            '#D73027'; // Red (0 km/h)
-        }
-        """
-        # Dynamic legend ranges for speed
-        legend_ranges_js = """
-        const legendRanges = [
-            { value: '70+ km/h', color: '#1A9850' },
-            { value: '61-70 km/h', color: '#66BD63' },
-            { value: '51-60 km/h', color: '#A6D96A' },
-            { value: '41-50 km/h', color: '#D9EF8B' },
-            { value: '31-40 km/h', color: '#FEE08B' },
-            { value: '21-30 km/h', color: '#FDAE61' },
-            { value: '1-20 km/h', color: '#F46D43' },
-            { value: '0 km/h', color: '#D73027' }
-        ];
-        """
-    else: # Default to number of vehicles (count-based KPI)
-        color_scale_js = """
-        function getColor(d) {
-            return d > 2000 ? '#A50026' : // Dark Red (2000+)
-                   d > 1000 ? '#D73027' : // Red (1001-2000)
-                   d > 500  ? '#F46D43' : // Orange-Red (501-1000)
-                   d > 200  ? '#FDAE61' : // Orange (201-500)
-                   d > 100  ? '#FEE08B' : // Light Orange (101-200)
-                   d > 50   ? '#D9EF8B' : // Yellow-Green (51-100)
-                   d > 20   ? '#A6D96A' : // Light Green (21-50)
-                              '#66BD63'; // Dark Green (0-20)
-        }
-        """
-        # Dynamic legend ranges for count
-        legend_ranges_js = """
-        const legendRanges = [
-            { value: '2000+', color: '#A50026' },
-            { value: '1001-2000', color: '#D73027' },
-            { value: '501-1000', color: '#F46D43' },
-            { value: '201-500', color: '#FDAE61' },
-            { value: '101-200', color: '#FEE08B' },
-            { value: '51-100', color: '#D9EF8B' },
-            { value: '21-50', color: '#A6D96A' },
-            { value: '0-20', color: '#66BD63' }
-        ];
-        """
-    
-    # Define legend_labels_js here
-    legend_labels_js = """
-    for (let i = 0; i < legendRanges.length; i++) {
-        labels.push(
-            '<i style="background:' + legendRanges[i].color + '"></i> ' +
-            legendRanges[i].value
-        );
-    }
-    """
-
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Berlin Traffic Map Animation</title>
-        <meta charset="utf-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
-        <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
-        <style>
-            body {{ margin: 0; padding: 0; font-family: 'Inter', sans-serif; }}
-            #map {{ height: 90vh; width: 100%; border-radius: 8px; }} /* Adjusted height here */
-            .map-controls {{
-                position: absolute;
-                bottom: 10px;
-                left: 50%;
-                transform: translateX(-50%);
-                z-index: 1000;
-                background: rgba(255, 255, 255, 0.9);
-                padding: 10px 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                display: flex;
-                flex-direction: column; /* Arrange items vertically */
-                gap: 5px; /* Smaller gap between elements */
-                align-items: center;
-                width: calc(100% - 40px); /* Adjust width to fit */
-                max-width: 400px; /* Max width for better aesthetics */
-                box-sizing: border-box; /* Include padding in width */
-            }}
-            .map-controls #timeDisplay {{
-                font-size: 1.1em;
-                font-weight: bold;
-                color: #333;
-                text-align: center;
-                width: 100%; /* Take full width */
-            }}
-            /* Progress Bar Styles */
-            .progress-container {{
-                width: 100%;
-                background-color: #f3f3f3;
-                border-radius: 5px;
-                overflow: hidden;
-            }}
-            .progress-bar {{
-                height: 10px;
-                width: 0%;
-                background-color: #4CAF50; /* Green progress bar */
-                border-radius: 5px;
-                transition: width 0.1s linear; /* Smooth transition for progress */
-            }}
-
-            /* Streamlit-specific styles for the embedded iframe to remove default margins */
-            html, body {{
-                margin: 0;
-                padding: 0;
-                overflow: hidden; /* Prevent scrollbars inside iframe */
-            }}
-            /* Legend Styles */
-            .info.legend {{
-                background: white;
-                padding: 6px 8px;
-                line-height: 18px;
-                color: #555;
-                border-radius: 5px;
-                box-shadow: 0 0 15px rgba(0,0,0,0.2);
-            }}
-            .info.legend i {{
-                width: 18px;
-                height: 18px;
-                float: left;
-                margin-right: 8px;
-                opacity: 0.7;
-            }}
-        </style>
-    </head>
-    <body>
-        <div id="map"></div>
-        <div class="map-controls">
-            <span id="timeDisplay"></span>
-            <div class="progress-container">
-                <div id="progressBar" class="progress-bar"></div>
-            </div>
-        </div>
-
-        <script>
-            // Embed data from Python
-            const allGeoJsonData = {geojson_json_str};
-            const availableTimes = {times_json_str};
-            let animationStartIndex = {start_idx};
-            let animationEndIndex = {end_idx};
-            const animationSpeed = {speed_ms}; // Speed in milliseconds
-            let autoPlayOnLoad = {json.dumps(auto_play_on_load)}; // Pass auto_play_on_load flag
-
-            let map;
-            let geoJsonLayer;
-            let animationInterval;
-            let currentAnimationIndex; // This will be updated by Python and used on re-render
-            let timeDisplay = document.getElementById('timeDisplay');
-            let progressBar = document.getElementById('progressBar'); // Get progress bar element
-
-            // Initialize map
-            function initMap() {{
-                try {{
-                    // Retrieve last known map view from localStorage if available
-                    const lastMapView = JSON.parse(localStorage.getItem('lastMapView')) || {{}};
-                    const initialCenterLat = lastMapView.center ? lastMapView.center.lat : {initial_center[0]};
-                    const initialCenterLng = lastMapView.center ? lastMapView.center.lng : {initial_center[1]};
-                    const initialZoom = lastMapView.zoom ? lastMapView.zoom : {initial_zoom};
-
-                    map = L.map('map').setView([initialCenterLat, initialCenterLng], initialZoom);
-
-                    L.tileLayer('https://{{s}}.basemaps.cartocdn.com/light_all/{{z}}/{{x}}/{{y}}.png', {{
-                        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> &copy; <a href="https://carto.com/attributions">CartoDB</a>'
-                    }}).addTo(map);
-
-                    // Save map view on moveend and zoomend
-                    map.on('moveend', saveMapView);
-                    map.on('zoomend', saveMapView);
-
-
-                    // Initialize with the current index passed from Python
-                    currentAnimationIndex = {initial_current_idx};
-                    // Ensure currentAnimationIndex is within the valid range
-                    if (currentAnimationIndex < animationStartIndex || currentAnimationIndex > animationEndIndex) {{
-                        currentAnimationIndex = animationStartIndex;
-                    }}
-
-                    // Get the data for the current animation index from the full dataset
-                    const initialGeoJson = allGeoJsonData[availableTimes[currentAnimationIndex]];
-                    
-                    if (initialGeoJson && initialGeoJson.features && initialGeoJson.features.length > 0) {{
-                        geoJsonLayer = L.geoJson(initialGeoJson, {{
-                            style: styleFeature,
-                            onEachFeature: onEachFeature
-                        }}).addTo(map);
-                    }} else {{
-                        geoJsonLayer = L.geoJson(null).addTo(map); // Add an empty layer if no data
-                        console.warn("No features to display for initial timestamp:", availableTimes[currentAnimationIndex]);
-                    }}
-
-                    updateDisplayElements(); // Call to update time and progress bar
-
-                    // Add Legend
-                    addLegend(map);
-
-                    // If auto-play was active, restart it
-                    if (autoPlayOnLoad) {{
-                        startAnimation();
-                    }}
-
-                }} catch (e) {{
-                    console.error("Error initializing map:", e);
-                }}
-            }}
-
-            // Function to save map view to localStorage
-            function saveMapView() {{
-                const view = {{
-                    center: map.getCenter(),
-                    zoom: map.getZoom()
-                }};
-                localStorage.setItem('lastMapView', JSON.stringify(view));
-            }}
-
-            // Color scale function
-            {color_scale_js}
-
-            // Legend ranges (must match getColor logic)
-            {legend_ranges_js}
-
-            // Style function for GeoJSON features
-            function styleFeature(feature) {{
-                const value = feature.properties.value; // Now consistently 'value'
-                return {{
-                    color: getColor(value),
-                    weight: 4,
-                    opacity: 1,
-                }};
-            }}
-
-            // Function to add tooltips on feature hover
-            function onEachFeature(feature, layer) {{
-                if (feature.properties && feature.properties.value !== undefined) {{ 
-                    layer.bindTooltip(
-                        `<b>Street:</b> ${{feature.properties.name_road_segment}}<br>` +
-                        `<b>{selected_kpi_type_label}:</b> ${{feature.properties.value !== undefined ? feature.properties.value.toFixed(2) : 'N/A'}}`,
-                        {{permanent: false, direction: 'auto', sticky: true}}
-                    );
-                }}
-            }}
-
-            // Function to update the map layer's style and display elements
-            function updateMapLayer() {{
-                try {{
-                    // Only update if the current index is within the active animation range
-                    if (currentAnimationIndex >= animationStartIndex && currentAnimationIndex <= animationEndIndex) {{
-                        const currentTime = availableTimes[currentAnimationIndex];
-                        const currentData = allGeoJsonData[currentTime];
-
-                        if (map.hasLayer(geoJsonLayer)) {{
-                            map.removeLayer(geoJsonLayer);
-                        }}
-                        
-                        if (currentData && currentData.features && currentData.features.length > 0) {{
-                            geoJsonLayer = L.geoJson(currentData, {{
-                                style: styleFeature,
-                                onEachFeature: onEachFeature
-                            }}).addTo(map);
-                        }} else {{
-                            geoJsonLayer = L.geoJson(null).addTo(map); // Add an empty layer if no data
-                            console.warn("No features to display for timestamp:", currentTime);
-                        }}
-
-                        updateDisplayElements(); // Call to update time and progress bar
-                    }}
-                }} catch (e) {{
-                    console.error("Error updating map layer:", e);
-                }}
-            }}
-
-            // Function to update the time display and progress bar
-            function updateDisplayElements() {{
-                timeDisplay.textContent = availableTimes[currentAnimationIndex];
-
-                // Calculate progress based on the *selected* animation range
-                const totalFramesInSelectedRange = animationEndIndex - animationStartIndex + 1;
-                const currentFrameInSelectedRange = currentAnimationIndex - animationStartIndex;
-                
-                // Ensure totalFramesInSelectedRange is not zero to avoid division by zero
-                if (totalFramesInSelectedRange > 0) {{
-                    const progress = (currentFrameInSelectedRange / (totalFramesInSelectedRange - 1)) * 100;
-                    progressBar.style.width = progress + '%';
-                }} else {{
-                    progressBar.style.width = '0%'; // No progress if no frames
-                }}
-            }}
-
-            // Animation functions
-            function startAnimation() {{
-                if (animationInterval) {{
-                    clearInterval(animationInterval);
-                }}
-                // Ensure currentAnimationIndex is within the animation range
-                if (currentAnimationIndex < animationStartIndex || currentAnimationIndex > animationEndIndex) {{
-                    currentAnimationIndex = animationStartIndex;
-                }}
-                updateMapLayer(); // Display first frame immediately
-
-                animationInterval = setInterval(() => {{
-                    currentAnimationIndex++;
-                    if (currentAnimationIndex <= animationEndIndex) {{
-                        updateMapLayer();
-                    }} else {{
-                        // Loop back to the start of the selected range
-                        currentAnimationIndex = animationStartIndex;
-                        updateMapLayer();
-                    }}
-                }}, animationSpeed);
-            }}
-
-            function stopAnimation() {{
-                clearInterval(animationInterval);
-                animationInterval = null;
-            }}
-
-            // Function to add the legend to the map
-            function addLegend(mapInstance) {{
-                const legend = L.control({{position: 'topright'}});
-
-                legend.onAdd = function (map) {{
-                    const div = L.DomUtil.create('div', 'info legend');
-                    let labels = ['<b>{legend_title}</b>']; // Dynamic title
-
-                    {legend_labels_js}
-
-                    div.innerHTML = labels.join('<br>');
-                    return div;
-                }};
-
-                legend.addTo(mapInstance);
-            }}
-
-            // Initialize map on load
-            window.onload = initMap;
-
-        </script>
-    </body>
-    </html>
-    """
-    return html_content
-
 # --- Handle animation state from JavaScript (if playing) ---
 
 if st.session_state["auto_playing"]:
@@ -646,6 +402,9 @@ map_html_key = (
 # Get the display labels for the legend and tooltip
 current_v_type_label = [k for k, v in VEHICLE_TYPE_OPTIONS.items() if v == st.session_state["selected_vehicle_type"]][0]
 current_kpi_type_label = [k for k, v in KPI_TYPE_OPTIONS.items() if v == st.session_state["selected_kpi_type"]][0]
+history_kpi_label = f"{current_v_type_label} - {current_kpi_type_label}"
+if selected_statistic is not None:
+    current_kpi_type_label = f"{current_kpi_type_label} ({statistic_label})"
 
 
 map_html = create_map_html(
@@ -657,27 +416,111 @@ map_html = create_map_html(
     initial_current_idx=st.session_state["current_animation_index"], # Pass current index
     auto_play_on_load=auto_play_on_load_flag, # Pass auto-play flag
     selected_v_type_label=current_v_type_label, # Pass for JS legend/tooltip
-    selected_kpi_type_label=current_kpi_type_label # Pass for JS legend/tooltip
+    selected_kpi_type_label=current_kpi_type_label, # Pass for JS legend/tooltip
+    is_difference=selected_statistic == "comparison",
+    frame_hashes={ts: content_hash for ts, content_hash in frame_manifest.items() if content_hash},
+    district_boundaries=district_boundaries,
+    district_values=district_values
 )
 
-st.markdown("### 📍 Animated Traffic Map")
-components.html(map_html, height=700, scrolling=False)
-
-# --- Streamlit Buttons to control animation state ---
-st.sidebar.markdown("---")
-st.sidebar.header("Manual Animation Control")
-
-col1_sidebar, col2_sidebar = st.sidebar.columns(2)
+@st.fragment
+def render_map_and_history(map_html: str, selected_v_type: str, selected_kpi_type: str,
+                           kpi_label: str, range_start: str, range_end: str, all_frames_sent: bool):
+    """
+    Renders the map and the history of the clicked segment. Running as a fragment means a click
+    only reruns this function (one indexed lookup), not the snapshot loading above.
+    """
+    st.markdown("### 📍 Animated Traffic Map")
+    map_event = traffic_map_component(html=map_html, height=700, key="traffic_map", default=None)
+
+    # The component keeps returning its last event, so handle each event only once
+    if map_event and map_event.get("reported_at") != st.session_state["last_map_event_at"]:
+        st.session_state["last_map_event_at"] = map_event.get("reported_at")
+        if "map_level" in map_event:
+            st.session_state["map_level"] = map_event["map_level"]
+        # Segment frames that were skipped while zoomed out are only needed at segment level
+        showing_segments = st.session_state["map_level"] == "segments"
+
+        if map_event.get("event") == "segment_click" and map_event.get("segment_id"):
+            st.session_state["selected_segment"] = {
+                "segment_id": map_event["segment_id"],
+                "name": map_event.get("name")
+            }
+        elif map_event.get("event") == "frame_cache":
+            if map_event.get("unavailable"):
+                # No browser cache: always send every frame
+                st.session_state["frame_cache_disabled"] = True
+                needs_reload = not all_frames_sent and showing_segments
+            else:
+                st.session_state["client_frame_hashes"] = set(map_event.get("cached", []))
+                needs_reload = bool(map_event.get("missing")) and showing_segments
+            if needs_reload:
+                st.rerun() # Full app rerun to send the frames the browser could not find
+        elif map_event.get("event") == "map_level" and showing_segments and map_event.get("needs_frames"):
+            st.rerun() # Zoomed in past the district level: send the segment frames
+
+    st.markdown("### 📈 Road Segment History")
+    selected_segment = st.session_state["selected_segment"]
+    if selected_segment is None:
+        st.caption("Click a road segment on the map to show its hourly history.")
+        return
 
-with col1_sidebar:
-    if st.button("Start Animation", key="start_animation_btn", disabled=st.session_state["auto_playing"]):
-        st.session_state["auto_playing"] = True
-        st.session_state["current_animation_index"] = st.session_state["animation_start_index"]
-        time.sleep(0.1)
-        st.rerun() 
+    try:
+        history = load_segment_timeseries(
+            MONGO_URI, DB_NAME, TIMESERIES_COLLECTION_NAME,
+            selected_segment["segment_id"], selected_v_type, selected_kpi_type
+        )
+    except Exception as e:
+        st.error(f"Error loading segment history from MongoDB: {e}")
+        return
+
+    history = history.loc[range_start:range_end]
+    if history.dropna().empty:
+        st.info(f"No history available for {selected_segment['name']} in the selected time range.")
+        return
+
+    st.caption(f"**{selected_segment['name']}** - {kpi_label}")
+    st.line_chart(history.rename(kpi_label))
+
+render_map_and_history(
+    map_html,
+    st.session_state["selected_vehicle_type"],
+    st.session_state["selected_kpi_type"],
+    history_kpi_label,
+    start_time_str,
+    end_time_str,
+    all_frames_sent=len(all_geojson_data) == len(available_times_for_animation)
+)
 
-with col2_sidebar:
-    if st.button("Stop Animation", key="stop_animation_btn", disabled=not st.session_state["auto_playing"]):
-        st.session_state["auto_playing"] = False
-        time.sleep(0.1)
-        st.rerun() 
\ No newline at end of file
+# --- Live data: poll the catalog and rerun when new hours have been ingested ---
+@st.fragment(run_every="30s")
+def watch_for_new_hours(latest_known_time: str):
+    catalog = get_mongo_client(MONGO_URI)[DB_NAME][CATALOG_COLLECTION_NAME].find_one(
+        {"_id": "timestamps"}, {"_id": 0, "latest_timestamp": 1}
+    )
+    if catalog and catalog.get("latest_timestamp", "") > latest_known_time:
+        st.rerun()
+
+if st.sidebar.toggle("Follow live data", value=False, key="follow_live_toggle",
+                     help="Checks every 30 seconds for newly ingested hours"):
+    watch_for_new_hours(unique_times[-1])
+
+# --- Streamlit Buttons to control animation state (not needed for a single statistics frame) ---
+if selected_statistic is None:
+    st.sidebar.markdown("---")
+    st.sidebar.header("Manual Animation Control")
+
+    col1_sidebar, col2_sidebar = st.sidebar.columns(2)
+
+    with col1_sidebar:
+        if st.button("Start Animation", key="start_animation_btn", disabled=st.session_state["auto_playing"]):
+            st.session_state["auto_playing"] = True
+            st.session_state["current_animation_index"] = st.session_state["animation_start_index"]
+            time.sleep(0.1)
+            st.rerun() 
+
+    with col2_sidebar:
+        if st.button("Stop Animation", key="stop_animation_btn", disabled=not st.session_state["auto_playing"]):
+            st.session_state["auto_playing"] = False
+            time.sleep(0.1)
+            st.rerun() 
\ No newline at end of file
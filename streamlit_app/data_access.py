@@ -0,0 +1,364 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient
+
+# --- MongoDB Data Loading Functions (used by Home.py and the load test in scripts/) ---
+SNAPSHOT_FETCH_WORKERS = int(os.getenv("SNAPSHOT_FETCH_WORKERS", "4")) # Parallel day-chunk queries
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "24")) # Documents per cursor batch (one day of frames)
+
+def _fetch_snapshot_chunk(collection, selected_vehicle_type: str, selected_kpi_type: str, chunk_times: list) -> dict:
+    """
+    Fetches the frames of one chunk (one day) as {timestamp: FeatureCollection}.
+    """
+    query = {
+        "timestamp": {"$in": chunk_times},
+        "vehicle_type": selected_vehicle_type,
+        "kpi_type": selected_kpi_type
+    }
+    # Bounded batches keep memory flat and let the cursor stream instead of materializing all at once
+    cursor = collection.find(query, {"_id": 0, "timestamp": 1, "features": 1}).batch_size(SNAPSHOT_BATCH_SIZE)
+    # MongoDB BSON documents are directly usable as Python dictionaries.
+    # Convert to FeatureCollection format for Leaflet's L.geoJSON
+    return {doc["timestamp"]: {"type": "FeatureCollection", "features": doc["features"]} for doc in cursor}
+
+def load_available_times(mongo_uri: str, db_name: str, collection_name: str, catalog_collection_name: str) -> list:
+    """
+    Available timestamps, from the catalog kept up to date by the generator and the live ingest
+    (falls back to a distinct scan of the snapshots when there is no catalog).
+    """
+    db = get_mongo_client(mongo_uri)[db_name]
+    catalog = db[catalog_collection_name].find_one({"_id": "timestamps"})
+    return catalog["timestamps"] if catalog else db[collection_name].distinct("timestamp")
+
+def load_frame_manifest(mongo_uri: str, db_name: str, collection_name: str,
+                        selected_vehicle_type: str, selected_kpi_type: str,
+                        time_range_times: list) -> dict:
+    """
+    Returns {timestamp: content_hash} for the frames in the time range, sorted by timestamp.
+    Only the small manifest fields are read (covered by the generator's manifest index).
+    """
+    collection = get_mongo_client(mongo_uri)[db_name][collection_name]
+    cursor = collection.find(
+        {
+            "timestamp": {"$in": time_range_times},
+            "vehicle_type": selected_vehicle_type,
+            "kpi_type": selected_kpi_type
+        },
+        {"_id": 0, "timestamp": 1, "content_hash": 1}
+    )
+    manifest = {doc["timestamp"]: doc.get("content_hash") for doc in cursor}
+    return {ts: manifest[ts] for ts in sorted(manifest)}
+
+def load_snapshots_from_mongodb(mongo_uri: str, db_name: str, collection_name: str,
+                                 selected_vehicle_type: str, selected_kpi_type: str,
+                                 time_range_times: list, on_chunk_loaded=None) -> dict:
+    """
+    Loads specific GeoJSON snapshots from MongoDB based on selected filters and time range.
+    The range is split into day-sized chunks fetched in parallel; on_chunk_loaded(frames, chunks_done, chunk_count)
+    is called in chronological order as chunks arrive, so the caller can render before the whole range is loaded.
+    """
+    all_geojson_data = {}
+    try:
+        collection = get_mongo_client(mongo_uri)[db_name][collection_name]
+
+        # Day-sized chunks ("YYYY-MM-DD HH:00" timestamps share their first 10 characters within a day)
+        chunks = {}
+        for ts in time_range_times:
+            chunks.setdefault(ts[:10], []).append(ts)
+        chunk_list = [chunks[day] for day in sorted(chunks)]
+
+        with ThreadPoolExecutor(max_workers=SNAPSHOT_FETCH_WORKERS) as executor:
+            futures = [
+                executor.submit(_fetch_snapshot_chunk, collection, selected_vehicle_type, selected_kpi_type, chunk_times)
+                for chunk_times in chunk_list
+            ]
+            # Consume in submission order so frames always arrive chronologically
+            for chunks_done, future in enumerate(futures, start=1):
+                all_geojson_data.update(future.result())
+                if on_chunk_loaded is not None:
+                    try:
+                        on_chunk_loaded(all_geojson_data, chunks_done, len(futures))
+                    except Exception as e:
+                        # Only the preview failed: keep loading, the full map is rendered afterwards
+                        print(f"⚠️ Preview of the loaded frames failed, continuing without it: {e}")
+                        on_chunk_loaded = None
+
+        if not all_geojson_data:
+            st.warning(f"No data found for the selected combination: Vehicle Type='{selected_vehicle_type}', KPI='{selected_kpi_type}' within the time range.")
+            return {}
+
+        # Sort the dictionary by timestamp keys to ensure correct animation order
+        return {k: all_geojson_data[k] for k in sorted(all_geojson_data)}
+
+    except Exception as e:
+        st.error(f"Error loading snapshots from MongoDB: {e}")
+        return {} # Return empty dict on error
+
+@st.cache_resource
+def get_mongo_client(mongo_uri: str) -> MongoClient:
+    """
+    Shared MongoClient for latency-sensitive lookups, so clicks do not pay for a new connection.
+    """
+    return MongoClient(mongo_uri)
+
+def load_segment_timeseries(mongo_uri: str, db_name: str, collection_name: str,
+                            segment_id: str, selected_vehicle_type: str, selected_kpi_type: str) -> pd.Series:
+    """
+    Loads the hourly history of one road segment from the segment-major collection.
+    Each document holds one month of packed hourly values, so this reads one document per month.
+    """
+    collection = get_mongo_client(mongo_uri)[db_name][collection_name]
+    cursor = collection.find(
+        {"segment_id": segment_id, "vehicle_type": selected_vehicle_type, "kpi_type": selected_kpi_type},
+        {"_id": 0, "month": 1, "values": 1}
+    ).sort("month", 1)
+
+    monthly_series = []
+    for doc in cursor:
+        # Slot i of the packed array is hour i since the start of the month
+        index = pd.date_range(f"{doc['month']}-01", periods=len(doc["values"]), freq="h")
+        monthly_series.append(pd.Series(doc["values"], index=index, dtype="float64"))
+
+    if not monthly_series:
+        return pd.Series(dtype="float64")
+    return pd.concat(monthly_series)
+
+@st.cache_data(ttl=3600)
+def load_district_boundaries(mongo_uri: str, db_name: str, collection_name: str) -> dict:
+    """
+    District polygons as a FeatureCollection (stored once by the generator; empty if there are none).
+    """
+    collection = get_mongo_client(mongo_uri)[db_name][collection_name]
+    features = [
+        {"type": "Feature", "geometry": doc["geometry"], "properties": {"district": doc["district"]}}
+        for doc in collection.find({}, {"_id": 0, "district": 1, "geometry": 1})
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+def load_district_values(mongo_uri: str, db_name: str, collection_name: str,
+                         selected_vehicle_type: str, selected_kpi_type: str,
+                         time_range_times: list) -> dict:
+    """
+    Returns {timestamp: {district: value}} for the time range. A handful of numbers per hour,
+    so the whole range is loaded in one query.
+    """
+    collection = get_mongo_client(mongo_uri)[db_name][collection_name]
+    cursor = collection.find(
+        {
+            "timestamp": {"$in": time_range_times},
+            "vehicle_type": selected_vehicle_type,
+            "kpi_type": selected_kpi_type
+        },
+        {"_id": 0, "timestamp": 1, "districts": 1}
+    )
+    return {
+        doc["timestamp"]: {district: entry["value"] for district, entry in doc["districts"].items()}
+        for doc in cursor
+    }
+
+# --- Memory-mapped value matrices (written by scripts/processor/value_matrix.py) ---
+VALUE_MATRIX_DIR = os.getenv("VALUE_MATRIX_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "value_matrix")
+
+class ValueMatrix:
+    """
+    Segments x hours values of one vehicle type/KPI, memory-mapped read-only. All app processes
+    on a host share the page-cached file; a time range is a zero-copy view of contiguous hour columns.
+    """
+
+    def __init__(self, matrix_dir: str, vehicle_type: str, kpi_type: str):
+        with open(os.path.join(matrix_dir, "matrix_meta.json")) as f:
+            meta = json.load(f)
+        self.start = pd.Timestamp(meta["start"])
+        self.hours = meta["hours"]
+        # All files come from the generation directory named by the metadata, which is only replaced
+        # once that generation is complete
+        generation_dir = os.path.join(matrix_dir, meta["directory"])
+        with open(os.path.join(generation_dir, f"{vehicle_type}_{kpi_type}_hashes.json")) as f:
+            self.content_hashes = json.load(f)
+        self.values = np.load(os.path.join(generation_dir, f"{vehicle_type}_{kpi_type}.npy"), mmap_mode="r")
+
+        df_index = pd.read_parquet(os.path.join(generation_dir, "segment_index.parquet"))
+        self.segment_ids = df_index["segment_id"].tolist()
+        self.names = df_index["name_road_segment"].tolist()
+        self.geometries = [json.loads(geometry) for geometry in df_index["geometry"]]
+
+        if (self.values.shape != (meta["segments"], self.hours) or len(self.segment_ids) != meta["segments"]
+                or len(self.content_hashes) != self.hours):
+            raise ValueError(f"Value matrix {vehicle_type}_{kpi_type} in {generation_dir} does not match its metadata")
+
+    def column(self, ts_str: str):
+        """
+        Hour column of a "YYYY-MM-DD HH:00" timestamp, or None if it is outside the matrix.
+        """
+        offset = int((pd.Timestamp(ts_str) - self.start) / pd.Timedelta(hours=1))
+        return offset if 0 <= offset < self.hours else None
+
+    def frames(self, frame_manifest: dict) -> dict:
+        """
+        Returns {timestamp: FeatureCollection} for the hours of frame_manifest ({timestamp: content_hash})
+        whose column was built from that same snapshot, so a frame is only ever sent under the hash of
+        its own data. Hours outside the matrix or from another generation of the snapshots are left out.
+        """
+        columns = {ts: self.column(ts) for ts, content_hash in frame_manifest.items() if content_hash}
+        columns = {ts: col for ts, col in columns.items()
+                   if col is not None and self.content_hashes[col] == frame_manifest[ts]}
+        if not columns:
+            return {}
+        first, last = min(columns.values()), max(columns.values())
+        block = self.values[:, first:last + 1]  # View into the mapped file, nothing is copied
+
+        frames = {}
+        for ts, col in columns.items():
+            hour_values = block[:, col - first]
+            rows = np.flatnonzero(~np.isnan(hour_values))
+            if rows.size == 0:
+                continue
+            frames[ts] = {"type": "FeatureCollection", "features": [
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "segment_id": self.segment_ids[row],
+                        "name_road_segment": self.names[row],
+                        "value": float(hour_values[row])
+                    },
+                    "geometry": self.geometries[row]
+                }
+                for row in rows
+            ]}
+        return frames
+
+def value_matrix_generation(matrix_dir: str):
+    """
+    Changes whenever the generator rewrites the matrices (its metadata file is replaced last); None if there are none.
+    """
+    try:
+        return os.stat(os.path.join(matrix_dir, "matrix_meta.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+@st.cache_resource(max_entries=12)
+def load_value_matrix(matrix_dir: str, selected_vehicle_type: str, selected_kpi_type: str, generation):
+    """
+    Opens the value matrix of a vehicle type/KPI once per process and generation
+    (pass value_matrix_generation(matrix_dir), so a regenerated matrix is mapped again). None if there is none.
+    """
+    if generation is None:
+        return None
+    try:
+        return ValueMatrix(matrix_dir, selected_vehicle_type, selected_kpi_type)
+    except FileNotFoundError:
+        return None
+    except (KeyError, ValueError) as e:
+        # Inconsistent or outdated files: serve the frames from MongoDB instead
+        print(f"⚠️ Ignoring value matrix: {e}")
+        return None
+
+def _slots_by_month(period_times) -> dict:
+    """
+    Groups hourly timestamps into {month: [slot, ...]} positions of the packed monthly arrays.
+    Must match the generator's layout (scripts/processor/timeseries.py): slot = (day - 1) * 24 + hour.
+    """
+    slots = {}
+    for ts in period_times:
+        slots.setdefault(ts.strftime("%Y-%m"), []).append((ts.day - 1) * 24 + ts.hour)
+    return slots
+
+def _period_values_expr(slots_by_month: dict) -> dict:
+    # Picks a period's hourly values out of each month document's packed array (missing slots become null)
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$month", month]},
+             "then": {"$map": {"input": slots, "in": {"$arrayElemAt": ["$values", "$$this"]}}}}
+            for month, slots in slots_by_month.items()
+        ],
+        "default": []
+    }}
+
+def _period_sum_count_expr(field: str) -> dict:
+    # Partial sum and count of non-null values, so means can be combined across month documents
+    return {
+        f"{field}_sum": {"$sum": f"${field}"},
+        f"{field}_count": {"$size": {"$filter": {"input": f"${field}", "cond": {"$ne": ["$$this", None]}}}}
+    }
+
+def load_segment_statistics(mongo_uri: str, db_name: str, collection_name: str,
+                            selected_vehicle_type: str, selected_kpi_type: str,
+                            statistic: str, period_a: list, period_b: list = None,
+                            percentile: int = 50) -> dict:
+    """
+    Computes a per-segment statistic over a time range inside MongoDB (aggregation pipeline on the
+    segment-major collection) and returns it as a single GeoJSON FeatureCollection frame.
+    statistic is one of "mean", "percentile" or "comparison" (mean of period_a minus mean of period_b).
+    """
+    slots_a = _slots_by_month(period_a)
+    slots_b = _slots_by_month(period_b or [])
+    if not slots_a or (statistic == "comparison" and not slots_b):
+        return {}
+
+    pipeline = [
+        {"$match": {
+            "vehicle_type": selected_vehicle_type,
+            "kpi_type": selected_kpi_type,
+            "month": {"$in": sorted(set(slots_a) | set(slots_b))}
+        }},
+        {"$project": {
+            "_id": 0, "segment_id": 1, "name_road_segment": 1, "geometry": 1,
+            "a": _period_values_expr(slots_a),
+            **({"b": _period_values_expr(slots_b)} if statistic == "comparison" else {})
+        }}
+    ]
+
+    if statistic == "percentile":
+        # $percentile needs the individual values, so unwind them (MongoDB 7.0+)
+        pipeline += [
+            {"$unwind": "$a"},
+            {"$match": {"a": {"$ne": None}}},
+            {"$group": {
+                "_id": "$segment_id",
+                "name_road_segment": {"$first": "$name_road_segment"},
+                "geometry": {"$first": "$geometry"},
+                "value": {"$percentile": {"input": "$a", "p": [percentile / 100], "method": "approximate"}}
+            }},
+            {"$set": {"value": {"$arrayElemAt": ["$value", 0]}}}
+        ]
+    else:
+        fields = ["a", "b"] if statistic == "comparison" else ["a"]
+        sum_count = {}
+        for field in fields:
+            sum_count.update(_period_sum_count_expr(field))
+        pipeline += [
+            {"$project": {"segment_id": 1, "name_road_segment": 1, "geometry": 1, **sum_count}},
+            {"$group": {
+                "_id": "$segment_id",
+                "name_road_segment": {"$first": "$name_road_segment"},
+                "geometry": {"$first": "$geometry"},
+                **{key: {"$sum": f"${key}"} for key in sum_count}
+            }},
+            {"$match": {f"{field}_count": {"$gt": 0} for field in fields}},
+        ]
+        mean_a = {"$divide": ["$a_sum", "$a_count"]}
+        if statistic == "comparison":
+            mean_b = {"$divide": ["$b_sum", "$b_count"]}
+            pipeline.append({"$set": {"value": {"$subtract": [mean_a, mean_b]}}})
+        else:
+            pipeline.append({"$set": {"value": mean_a}})
+
+    collection = get_mongo_client(mongo_uri)[db_name][collection_name]
+    features = [
+        {
+            "type": "Feature",
+            "geometry": doc["geometry"],
+            "properties": {
+                "segment_id": doc["_id"],
+                "name_road_segment": doc["name_road_segment"],
+                "value": doc["value"]
+            }
+        }
+        for doc in collection.aggregate(pipeline)
+    ]
+    return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,646 @@
+import os
+import json
+
+# Below this zoom level the map shows district aggregates instead of individual road segments
+DISTRICT_ZOOM_THRESHOLD = int(os.getenv("DISTRICT_ZOOM_THRESHOLD", "12"))
+
+# --- Color Scales ---
+# Shared by the interactive map (getColor in the browser) and the pre-rendered export (scripts/export_animation.py).
+# Each scale lists (comparison, threshold, color, legend label) from the top; the last entry catches everything else.
+COLOR_SCALES = {
+    "speed_difference": [ # Speed difference between periods
+        (">", 10, "#1A9850", "+10 km/h and more"), # Much faster
+        (">", 5, "#66BD63", "+6 to +10 km/h"), # Faster
+        (">", 2, "#D9EF8B", "+3 to +5 km/h"), # Slightly faster
+        (">=", -2, "#F7F7F7", "-2 to +2 km/h"), # Unchanged
+        (">=", -5, "#FEE08B", "-3 to -5 km/h"), # Slightly slower
+        (">=", -10, "#F46D43", "-6 to -10 km/h"), # Slower
+        (None, None, "#D73027", "-10 km/h and less"), # Much slower
+    ],
+    "count_difference": [ # Vehicle count difference between periods
+        (">", 500, "#A50026", "+500 and more"), # Much more traffic
+        (">", 100, "#F46D43", "+101 to +500"), # More traffic
+        (">", 20, "#FEE08B", "+21 to +100"), # Slightly more traffic
+        (">=", -20, "#F7F7F7", "-20 to +20"), # Unchanged
+        (">=", -100, "#A6D96A", "-21 to -100"), # Slightly less traffic
+        (">=", -500, "#66BD63", "-101 to -500"), # Less traffic
+        (None, None, "#1A9850", "-500 and less"), # Much less traffic
+    ],
+    "speed": [
+        (">", 70, "#1A9850", "70+ km/h"), # Dark Green
+        (">", 60, "#66BD63", "61-70 km/h"), # Green
+        (">", 50, "#A6D96A", "51-60 km/h"), # Light Green
+        (">", 40, "#D9EF8B", "41-50 km/h"), # Yellow-Green
+        (">", 30, "#FEE08B", "31-40 km/h"), # Light Orange
+        (">", 20, "#FDAE61", "21-30 km/h"), # Orange
+        (">", 0, "#F46D43", "1-20 km/h"), # Orange-Red
+        (None, None, "#D73027", "0 km/h"), # Red
+    ],
+    "count": [ # Number of vehicles
+        (">", 2000, "#A50026", "2000+"), # Dark Red
+        (">", 1000, "#D73027", "1001-2000"), # Red
+        (">", 500, "#F46D43", "501-1000"), # Orange-Red
+        (">", 200, "#FDAE61", "201-500"), # Orange
+        (">", 100, "#FEE08B", "101-200"), # Light Orange
+        (">", 50, "#D9EF8B", "51-100"), # Yellow-Green
+        (">", 20, "#A6D96A", "21-50"), # Light Green
+        (None, None, "#66BD63", "0-20"), # Dark Green
+    ],
+}
+
+def color_scale_key(kpi_type_label: str, is_difference: bool = False) -> str:
+    """
+    Picks the color scale for a KPI (label or internal key, e.g. "Average Speed" or "avg_speed").
+    """
+    is_speed = "speed" in kpi_type_label.lower()
+    if is_difference:
+        return "speed_difference" if is_speed else "count_difference"
+    return "speed" if is_speed else "count" # Default to number of vehicles (count-based KPI)
+
+def get_color(value: float, color_scale: list) -> str:
+    """
+    Python version of the map's getColor, for server-side rendering.
+    """
+    for comparison, threshold, color, _ in color_scale:
+        if comparison is None or (value > threshold if comparison == ">" else value >= threshold):
+            return color
+
+def _color_scale_js(color_scale: list) -> str:
+    lines = []
+    for i, (comparison, threshold, color, label) in enumerate(color_scale):
+        prefix = "return " if i == 0 else "       "
+        if comparison is None:
+            lines.append(f"{prefix}'{color}'; // {label}")
+        else:
+            lines.append(f"{prefix}d {comparison} {threshold} ? '{color}' : // {label}")
+    body = "\n            ".join(lines)
+    return f"""
+        function getColor(d) {{
+            {body}
+        }}
+        """
+
+def _legend_ranges_js(color_scale: list) -> str:
+    entries = ",\n            ".join(
+        f"{{ value: '{label}', color: '{color}' }}" for _, _, color, label in color_scale
+    )
+    return f"""
+        const legendRanges = [
+            {entries}
+        ];
+        """
+
+# --- Map HTML Generation ---
+def create_map_html(
+    geojson_data_all_times: dict, # Now contains data for specific vehicle/kpi combo
+    available_times_list: list, # List of times for the current combo
+    start_idx: int,
+    end_idx: int,
+    speed_ms: int, # Speed in milliseconds
+    initial_current_idx: int,
+    auto_play_on_load: bool,
+    initial_zoom: int = 12,
+    initial_center: list = [52.52, 13.405],
+    selected_v_type_label: str = "All Vehicles",
+    selected_kpi_type_label: str = "Number of Vehicles",
+    is_difference: bool = False, # Values are differences between two periods (diverging color scale)
+    frame_hashes: dict = None, # {time: content hash}; times without embedded data are read from the browser cache
+    district_boundaries: dict = None, # District polygons shown when zoomed out (None disables the district layer)
+    district_values: dict = None, # {time: {district: value}}
+    district_zoom_threshold: int = DISTRICT_ZOOM_THRESHOLD
+) -> str:
+    # Convert Python dicts/lists to JSON strings for embedding in JavaScript
+    geojson_json_str = json.dumps(geojson_data_all_times)
+    times_json_str = json.dumps(available_times_list)
+    frame_hashes_json_str = json.dumps(frame_hashes or {})
+    district_boundaries_json_str = json.dumps(district_boundaries if district_boundaries and district_boundaries.get("features") else None)
+    district_values_json_str = json.dumps(district_values or {})
+
+    # # Determine KPI for color scale, assuming 'value' field in GeoJSON properties
+    # kpi_field = "value"
+
+    # Dynamic legend based on selected KPI (passed from Python)
+    legend_title = f"{selected_v_type_label} - {selected_kpi_type_label}"
+    
+    # Define color scale based on the type of KPI (passed from Python)
+    color_scale = COLOR_SCALES[color_scale_key(selected_kpi_type_label, is_difference)]
+    color_scale_js = _color_scale_js(color_scale)
+    # Dynamic legend ranges (must match getColor logic)
+    legend_ranges_js = _legend_ranges_js(color_scale)
+    
+    # Define legend_labels_js here
+    legend_labels_js = """
+    for (let i = 0; i < legendRanges.length; i++) {
+        labels.push(
+            '<i style="background:' + legendRanges[i].color + '"></i> ' +
+            legendRanges[i].value
+        );
+    }
+    """
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Berlin Traffic Map Animation</title>
+        <meta charset="utf-8" />
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+        <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+        <style>
+            body {{ margin: 0; padding: 0; font-family: 'Inter', sans-serif; }}
+            #map {{ height: 90vh; width: 100%; border-radius: 8px; }} /* Adjusted height here */
+            .map-controls {{
+                position: absolute;
+                bottom: 10px;
+                left: 50%;
+                transform: translateX(-50%);
+                z-index: 1000;
+                background: rgba(255, 255, 255, 0.9);
+                padding: 10px 20px;
+                border-radius: 8px;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+                display: flex;
+                flex-direction: column; /* Arrange items vertically */
+                gap: 5px; /* Smaller gap between elements */
+                align-items: center;
+                width: calc(100% - 40px); /* Adjust width to fit */
+                max-width: 400px; /* Max width for better aesthetics */
+                box-sizing: border-box; /* Include padding in width */
+            }}
+            .map-controls #timeDisplay {{
+                font-size: 1.1em;
+                font-weight: bold;
+                color: #333;
+                text-align: center;
+                width: 100%; /* Take full width */
+            }}
+            /* Progress Bar Styles */
+            .progress-container {{
+                width: 100%;
+                background-color: #f3f3f3;
+                border-radius: 5px;
+                overflow: hidden;
+            }}
+            .progress-bar {{
+                height: 10px;
+                width: 0%;
+                background-color: #4CAF50; /* Green progress bar */
+                border-radius: 5px;
+                transition: width 0.1s linear; /* Smooth transition for progress */
+            }}
+
+            /* Streamlit-specific styles for the embedded iframe to remove default margins */
+            html, body {{
+                margin: 0;
+                padding: 0;
+                overflow: hidden; /* Prevent scrollbars inside iframe */
+            }}
+            /* Legend Styles */
+            .info.legend {{
+                background: white;
+                padding: 6px 8px;
+                line-height: 18px;
+                color: #555;
+                border-radius: 5px;
+                box-shadow: 0 0 15px rgba(0,0,0,0.2);
+            }}
+            .info.legend i {{
+                width: 18px;
+                height: 18px;
+                float: left;
+                margin-right: 8px;
+                opacity: 0.7;
+            }}
+        </style>
+    </head>
+    <body>
+        <div id="map"></div>
+        <div class="map-controls">
+            <span id="timeDisplay"></span>
+            <div class="progress-container">
+                <div id="progressBar" class="progress-bar"></div>
+            </div>
+        </div>
+
+        <script>
+            // Embed data from Python
+            const allGeoJsonData = {geojson_json_str};
+            const availableTimes = {times_json_str};
+            const frameHashes = {frame_hashes_json_str};
+            // District aggregates, shown instead of the segments below the zoom threshold
+            const districtBoundaries = {district_boundaries_json_str};
+            const districtValues = {district_values_json_str};
+            const districtZoomThreshold = {district_zoom_threshold};
+            let animationStartIndex = {start_idx};
+            let animationEndIndex = {end_idx};
+            const animationSpeed = {speed_ms}; // Speed in milliseconds
+            let autoPlayOnLoad = {json.dumps(auto_play_on_load)}; // Pass auto_play_on_load flag
+
+            let map;
+            let geoJsonLayer;
+            let animationInterval;
+            let currentAnimationIndex; // This will be updated by Python and used on re-render
+            let timeDisplay = document.getElementById('timeDisplay');
+            let progressBar = document.getElementById('progressBar'); // Get progress bar element
+
+            // Initialize map
+            function initMap() {{
+                try {{
+                    // Retrieve last known map view from localStorage if available
+                    const lastMapView = JSON.parse(localStorage.getItem('lastMapView')) || {{}};
+                    const initialCenterLat = lastMapView.center ? lastMapView.center.lat : {initial_center[0]};
+                    const initialCenterLng = lastMapView.center ? lastMapView.center.lng : {initial_center[1]};
+                    const initialZoom = lastMapView.zoom ? lastMapView.zoom : {initial_zoom};
+
+                    map = L.map('map').setView([initialCenterLat, initialCenterLng], initialZoom);
+
+                    L.tileLayer('https://{{s}}.basemaps.cartocdn.com/light_all/{{z}}/{{x}}/{{y}}.png', {{
+                        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> &copy; <a href="https://carto.com/attributions">CartoDB</a>'
+                    }}).addTo(map);
+
+                    // Save map view on moveend and zoomend
+                    map.on('moveend', saveMapView);
+                    map.on('zoomend', saveMapView);
+                    map.on('zoomend', onZoomChanged);
+                    shownMapLevel = currentMapLevel();
+
+
+                    // Initialize with the current index passed from Python
+                    currentAnimationIndex = {initial_current_idx};
+                    // Ensure currentAnimationIndex is within the valid range
+                    if (currentAnimationIndex < animationStartIndex || currentAnimationIndex > animationEndIndex) {{
+                        currentAnimationIndex = animationStartIndex;
+                    }}
+
+                    // Get the data for the current animation index from the full dataset
+                    const initialGeoJson = currentFrame(availableTimes[currentAnimationIndex]);
+                    
+                    if (initialGeoJson && initialGeoJson.features && initialGeoJson.features.length > 0) {{
+                        geoJsonLayer = L.geoJson(initialGeoJson, {{
+                            style: styleFeature,
+                            onEachFeature: onEachFeature
+                        }}).addTo(map);
+                    }} else {{
+                        geoJsonLayer = L.geoJson(null).addTo(map); // Add an empty layer if no data
+                        console.warn("No features to display for initial timestamp:", availableTimes[currentAnimationIndex]);
+                    }}
+
+                    updateDisplayElements(); // Call to update time and progress bar
+
+                    // Add Legend
+                    addLegend(map);
+
+                    // If auto-play was active, restart it
+                    if (autoPlayOnLoad) {{
+                        startAnimation();
+                    }}
+
+                }} catch (e) {{
+                    console.error("Error initializing map:", e);
+                }}
+            }}
+
+            // Function to save map view to localStorage
+            function saveMapView() {{
+                const view = {{
+                    center: map.getCenter(),
+                    zoom: map.getZoom()
+                }};
+                localStorage.setItem('lastMapView', JSON.stringify(view));
+            }}
+
+            // Decoding of quantized, polyline-encoded geometries (scripts/processor/geometry_codec.py)
+            const sequenceDepth = {{ LineString: 0, MultiLineString: 1, Polygon: 1, MultiPolygon: 2 }};
+            const decodedGeometryCache = new Map(); // Segment geometry repeats in every frame, decode it once
+
+            function decodePolyline(encoded, precision) {{
+                const factor = Math.pow(10, precision);
+                const coords = [];
+                let index = 0, lat = 0, lng = 0;
+                while (index < encoded.length) {{
+                    const deltas = [];
+                    for (let i = 0; i < 2; i++) {{
+                        let result = 0, shift = 0, byte;
+                        do {{
+                            byte = encoded.charCodeAt(index++) - 63;
+                            result |= (byte & 0x1f) << shift;
+                            shift += 5;
+                        }} while (byte >= 0x20);
+                        deltas.push((result & 1) ? ~(result >> 1) : (result >> 1));
+                    }}
+                    lat += deltas[0];
+                    lng += deltas[1];
+                    coords.push([lng / factor, lat / factor]); // GeoJSON order
+                }}
+                return coords;
+            }}
+
+            function decodeSequences(coordinates, depth, precision) {{
+                return depth === 0
+                    ? decodePolyline(coordinates, precision)
+                    : coordinates.map(part => decodeSequences(part, depth - 1, precision));
+            }}
+
+            function decodeGeometry(geometry) {{
+                if (!geometry || !geometry.type.startsWith('Encoded')) {{
+                    return geometry; // Plain GeoJSON
+                }}
+                const cacheKey = geometry.type + ':' + geometry.precision + ':' + [geometry.coordinates].flat(Infinity).join(' ');
+                if (!decodedGeometryCache.has(cacheKey)) {{
+                    const type = geometry.type.slice('Encoded'.length);
+                    decodedGeometryCache.set(cacheKey, {{
+                        type: type,
+                        coordinates: decodeSequences(geometry.coordinates, sequenceDepth[type], geometry.precision)
+                    }});
+                }}
+                return decodedGeometryCache.get(cacheKey);
+            }}
+
+            function decodeFrame(frame) {{
+                if (frame && frame.features && !frame.decoded) {{
+                    frame.features.forEach(feature => {{ feature.geometry = decodeGeometry(feature.geometry); }});
+                    frame.decoded = true;
+                }}
+                return frame;
+            }}
+
+            // --- District layer for low zoom levels ---
+            let shownMapLevel;
+
+            function mapLevelForZoom(zoom) {{
+                return districtBoundaries && zoom < districtZoomThreshold ? 'districts' : 'segments';
+            }}
+
+            function currentMapLevel() {{
+                if (map) {{
+                    return mapLevelForZoom(map.getZoom());
+                }}
+                // Before the map exists, use the zoom it will be restored to
+                const lastMapView = JSON.parse(localStorage.getItem('lastMapView')) || {{}};
+                return mapLevelForZoom(lastMapView.zoom ? lastMapView.zoom : {initial_zoom});
+            }}
+
+            // District polygons colored with one hour's values (the boundaries are decoded once)
+            function districtFrame(time) {{
+                const values = districtValues[time] || {{}};
+                return {{
+                    type: 'FeatureCollection',
+                    features: decodeFrame(districtBoundaries).features
+                        .filter(feature => values[feature.properties.district] !== undefined)
+                        .map(feature => ({{
+                            type: 'Feature',
+                            geometry: feature.geometry,
+                            properties: {{ district: feature.properties.district, value: values[feature.properties.district] }}
+                        }}))
+                }};
+            }}
+
+            function currentFrame(time) {{
+                return currentMapLevel() === 'districts' ? districtFrame(time) : decodeFrame(allGeoJsonData[time]);
+            }}
+
+            // Redraw when the zoom crosses the threshold; Python is told so it only fetches
+            // segment frames when they are actually shown
+            function onZoomChanged() {{
+                const level = currentMapLevel();
+                if (level === shownMapLevel) {{
+                    return;
+                }}
+                shownMapLevel = level;
+                updateMapLayer();
+                postMapEvent({{
+                    event: 'map_level',
+                    needs_frames: level === 'segments' && availableTimes.some(time => !allGeoJsonData[time])
+                }});
+            }}
+
+            // Color scale function
+            {color_scale_js}
+
+            // Legend ranges (must match getColor logic)
+            {legend_ranges_js}
+
+            // Style function for GeoJSON features
+            function styleFeature(feature) {{
+                const value = feature.properties.value; // Now consistently 'value'
+                if (feature.properties.district) {{
+                    return {{
+                        color: '#555',
+                        weight: 1,
+                        fillColor: getColor(value),
+                        fillOpacity: 0.6
+                    }};
+                }}
+                return {{
+                    color: getColor(value),
+                    weight: 4,
+                    opacity: 1,
+                }};
+            }}
+
+            // Function to add tooltips on feature hover
+            function onEachFeature(feature, layer) {{
+                if (feature.properties && feature.properties.value !== undefined) {{ 
+                    const placeLabel = feature.properties.district
+                        ? `<b>District:</b> ${{feature.properties.district}} (mean per road segment)<br>`
+                        : `<b>Street:</b> ${{feature.properties.name_road_segment}}<br>`;
+                    layer.bindTooltip(
+                        placeLabel +
+                        `<b>{selected_kpi_type_label}:</b> ${{feature.properties.value !== undefined ? feature.properties.value.toFixed(2) : 'N/A'}}`,
+                        {{permanent: false, direction: 'auto', sticky: true}}
+                    );
+                }}
+                // Report clicks to the component host, which passes them on to Python
+                if (!feature.properties.segment_id) {{
+                    return; // Districts have no history chart
+                }}
+                layer.on('click', () => {{
+                    postMapEvent({{
+                        event: 'segment_click',
+                        segment_id: feature.properties.segment_id,
+                        name: feature.properties.name_road_segment
+                    }});
+                }});
+            }}
+
+            // Send an event to Python through the component host
+            function postMapEvent(payload) {{
+                payload.reported_at = Date.now(); // Makes repeated identical events register
+                if (districtBoundaries) {{
+                    payload.map_level = currentMapLevel(); // Sent with every event, so no separate one is needed on load
+                }}
+                window.parent.postMessage({{ type: 'traffic_map:event', payload: payload }}, '*');
+            }}
+
+            // --- Browser-side frame cache (IndexedDB, keyed by the frame's content hash) ---
+            const FRAME_DB_NAME = 'berliflow-frame-cache';
+            const FRAME_STORE_NAME = 'frames';
+            const MAX_CACHED_FRAMES = 5000;
+
+            function idbRequest(request) {{
+                return new Promise((resolve, reject) => {{
+                    request.onsuccess = () => resolve(request.result);
+                    request.onerror = () => reject(request.error);
+                }});
+            }}
+
+            function openFrameDb() {{
+                if (!window.indexedDB) {{
+                    return Promise.reject(new Error('IndexedDB not available'));
+                }}
+                const request = indexedDB.open(FRAME_DB_NAME, 1);
+                request.onupgradeneeded = () => request.result.createObjectStore(FRAME_STORE_NAME);
+                return idbRequest(request);
+            }}
+
+            // Stores frames sent by Python, fills in the ones that were not sent from the cache and
+            // reports the cached hashes (and any still missing) so Python only sends what changed
+            async function syncFrameCache() {{
+                let db;
+                try {{
+                    db = await openFrameDb();
+                }} catch (e) {{
+                    console.warn("Frame cache unavailable:", e);
+                    postMapEvent({{ event: 'frame_cache', unavailable: true }});
+                    return;
+                }}
+
+                // All requests are issued up front so they run in one transaction, in order
+                const store = db.transaction(FRAME_STORE_NAME, 'readwrite').objectStore(FRAME_STORE_NAME);
+                for (const time of Object.keys(allGeoJsonData)) {{
+                    if (frameHashes[time]) {{
+                        store.put(allGeoJsonData[time], frameHashes[time]);
+                    }}
+                }}
+                const timesToRead = availableTimes.filter(time => !allGeoJsonData[time] && frameHashes[time]);
+                const reads = timesToRead.map(time => idbRequest(store.get(frameHashes[time])));
+                const cachedHashesRequest = idbRequest(store.getAllKeys());
+
+                const missing = [];
+                (await Promise.all(reads)).forEach((frame, i) => {{
+                    if (frame) {{
+                        allGeoJsonData[timesToRead[i]] = frame;
+                    }} else {{
+                        missing.push(frameHashes[timesToRead[i]]);
+                    }}
+                }});
+                let cachedHashes = await cachedHashesRequest;
+
+                // Keep the cache bounded: drop frames not used by this view once it grows too large
+                if (cachedHashes.length > MAX_CACHED_FRAMES) {{
+                    const inUse = new Set(Object.values(frameHashes));
+                    const cleanup = db.transaction(FRAME_STORE_NAME, 'readwrite').objectStore(FRAME_STORE_NAME);
+                    cachedHashes.filter(hash => !inUse.has(hash)).forEach(hash => cleanup.delete(hash));
+                    cachedHashes = cachedHashes.filter(hash => inUse.has(hash));
+                }}
+
+                postMapEvent({{ event: 'frame_cache', cached: cachedHashes, missing: missing }});
+            }}
+
+            // Function to update the map layer's style and display elements
+            function updateMapLayer() {{
+                try {{
+                    // Only update if the current index is within the active animation range
+                    if (currentAnimationIndex >= animationStartIndex && currentAnimationIndex <= animationEndIndex) {{
+                        const currentTime = availableTimes[currentAnimationIndex];
+                        const currentData = currentFrame(currentTime);
+
+                        if (map.hasLayer(geoJsonLayer)) {{
+                            map.removeLayer(geoJsonLayer);
+                        }}
+                        
+                        if (currentData && currentData.features && currentData.features.length > 0) {{
+                            geoJsonLayer = L.geoJson(currentData, {{
+                                style: styleFeature,
+                                onEachFeature: onEachFeature
+                            }}).addTo(map);
+                        }} else {{
+                            geoJsonLayer = L.geoJson(null).addTo(map); // Add an empty layer if no data
+                            console.warn("No features to display for timestamp:", currentTime);
+                        }}
+
+                        updateDisplayElements(); // Call to update time and progress bar
+                    }}
+                }} catch (e) {{
+                    console.error("Error updating map layer:", e);
+                }}
+            }}
+
+            // Function to update the time display and progress bar
+            function updateDisplayElements() {{
+                timeDisplay.textContent = availableTimes[currentAnimationIndex];
+
+                // Calculate progress based on the *selected* animation range
+                const totalFramesInSelectedRange = animationEndIndex - animationStartIndex + 1;
+                const currentFrameInSelectedRange = currentAnimationIndex - animationStartIndex;
+                
+                // Ensure totalFramesInSelectedRange is not zero to avoid division by zero
+                if (totalFramesInSelectedRange > 0) {{
+                    const progress = (currentFrameInSelectedRange / (totalFramesInSelectedRange - 1)) * 100;
+                    progressBar.style.width = progress + '%';
+                }} else {{
+                    progressBar.style.width = '0%'; // No progress if no frames
+                }}
+            }}
+
+            // Animation functions
+            function startAnimation() {{
+                if (animationInterval) {{
+                    clearInterval(animationInterval);
+                }}
+                // Ensure currentAnimationIndex is within the animation range
+                if (currentAnimationIndex < animationStartIndex || currentAnimationIndex > animationEndIndex) {{
+                    currentAnimationIndex = animationStartIndex;
+                }}
+                updateMapLayer(); // Display first frame immediately
+
+                animationInterval = setInterval(() => {{
+                    currentAnimationIndex++;
+                    if (currentAnimationIndex <= animationEndIndex) {{
+                        updateMapLayer();
+                    }} else {{
+                        // Loop back to the start of the selected range
+                        currentAnimationIndex = animationStartIndex;
+                        updateMapLayer();
+                    }}
+                }}, animationSpeed);
+            }}
+
+            function stopAnimation() {{
+                clearInterval(animationInterval);
+                animationInterval = null;
+            }}
+
+            // Function to add the legend to the map
+            function addLegend(mapInstance) {{
+                const legend = L.control({{position: 'topright'}});
+
+                legend.onAdd = function (map) {{
+                    const div = L.DomUtil.create('div', 'info legend');
+                    let labels = ['<b>{legend_title}</b>']; // Dynamic title
+
+                    {legend_labels_js}
+
+                    div.innerHTML = labels.join('<br>');
+                    return div;
+                }};
+
+                legend.addTo(mapInstance);
+            }}
+
+            // Initialize map on load
+            window.onload = async () => {{
+                try {{
+                    await syncFrameCache();
+                }} catch (e) {{
+                    console.error("Error syncing frame cache:", e);
+                }}
+                initMap();
+            }};
+
+        </script>
+    </body>
+    </html>
+    """
+    return html_content